@@ -1 +1 @@
-__all__ = ["constants","escpos","exceptions","printer"]
+__all__ = ["capabilities","constants","escpos","exceptions","optimizer","pool","printer","render","truetype"]
@@ -0,0 +1,277 @@
+""" Command line bulk printing
+
+  python -m escpos -p network:192.168.1.50 receipt.bin
+  python -m escpos -p usb:04b8:0202 --profile TM-T88V logo.png
+  cat jobs.jsonl | python -m escpos -p serial:/dev/ttyS0:19200 -f json
+  python -m escpos --dry-run out.bin --repeat 100 -t jobs.jsonl
+
+Raw input is copied as is, images are printed with Escpos.image() and
+JSON input holds one command per line mapped to an Escpos method:
+
+  {"method": "set", "align": "center", "width": 2}
+  {"method": "text", "args": ["Table 4\\n"]}
+  {"method": "cut"}
+
+Every cut ends a JSON job, every raw or image file is a job on its own.
+Input is read, encoded and written by a bounded pipeline, so memory use
+does not grow with the input size.
+"""
+
+from __future__ import absolute_import
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import Queue
+
+from escpos import printer
+from escpos.exceptions import Error
+
+# Bytes read from raw input at once
+CHUNK_SIZE = 64 * 1024
+# Chunks waiting to be written
+QUEUE_DEPTH = 16
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".pbm")
+JSON_EXTENSIONS = (".json", ".jsonl")
+
+
+def open_printer(spec, profile):
+    """ Build a backend from network:HOST[:PORT], file:PATH,
+    serial:DEVICE[:BAUDRATE] or usb:VENDOR:PRODUCT """
+    kind, _, rest = spec.partition(":")
+    if kind == "network":
+        host, _, port = rest.partition(":")
+        return printer.Network(host, int(port or 9100), profile=profile)
+    if kind == "file":
+        return printer.File(rest, profile=profile)
+    if kind == "serial":
+        device, _, baudrate = rest.partition(":")
+        return printer.Serial(device, int(baudrate or 9600), profile=profile)
+    if kind == "usb":
+        vendor, _, product = rest.partition(":")
+        return printer.Usb(int(vendor, 16), int(product, 16), profile=profile)
+    raise ValueError("Unknown printer %s, use network:, file:, serial: or usb:"
+                     % spec)
+
+
+def input_format(name, forced):
+    if forced != "auto":
+        return forced
+    ext = os.path.splitext(name)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    if ext in JSON_EXTENSIONS:
+        return "json"
+    return "raw"
+
+
+def _encode(value, encoding):
+    """ Turn the unicode strings of a JSON command into bytes """
+    if isinstance(value, unicode):
+        return value.encode(encoding, "replace")
+    if isinstance(value, list):
+        return [_encode(v, encoding) for v in value]
+    if isinstance(value, dict):
+        return dict((str(k), _encode(v, encoding)) for k, v in value.items())
+    return value
+
+
+class Pipeline:
+    """ Read, encode and write jobs with a bounded queue between the
+    encoder and the printer """
+
+    def __init__(self, target, profile, encoding="cp437", optimize=False):
+        self.target = target
+        self.encoder = printer.Dummy(profile)
+        self.encoding = encoding
+        self.optimize = optimize
+        self.queue = Queue.Queue(QUEUE_DEPTH)
+        self.bytes = 0
+        self.jobs = 0
+        self.error = None
+        self.writer = threading.Thread(target=self._write)
+        self.writer.daemon = True
+
+    def start(self):
+        self.writer.start()
+
+    def finish(self):
+        self.queue.put(None)
+        self.writer.join()
+        if self.error is not None:
+            raise self.error
+
+    def _write(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            if self.error is not None:
+                # Keep draining so the reader never blocks
+                continue
+            try:
+                self.target._send(chunk)
+                self.bytes += len(chunk)
+            except Exception, e:
+                self.error = e
+
+    def _put(self, chunk):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(chunk)
+
+    def _end_job(self):
+        """ Queue what the encoder holds as one job """
+        if self.optimize:
+            self.encoder.optimize()
+        data = self.encoder.output
+        self.encoder.clear()
+        if data:
+            self._put(data)
+        self.jobs += 1
+
+    def raw(self, fd):
+        while True:
+            chunk = fd.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            self._put(chunk)
+        self.jobs += 1
+
+    def image(self, fname):
+        self.encoder.image(fname)
+        self._end_job()
+
+    def json(self, fd):
+        pending = False
+        for lineno, line in enumerate(fd):
+            if not line.strip():
+                continue
+            try:
+                command = _encode(json.loads(line), self.encoding)
+                name = command.pop("method")
+                args = command.pop("args", [])
+            except (ValueError, KeyError, AttributeError):
+                raise ValueError("Line %d is not a valid JSON command"
+                                 % (lineno + 1))
+            if not isinstance(name, str) or name.startswith("_") \
+                    or not callable(getattr(self.encoder, name, None)):
+                raise ValueError("Line %d: unknown method %r"
+                                 % (lineno + 1, name))
+            try:
+                getattr(self.encoder, name)(*args, **command)
+            except (TypeError, AttributeError), e:
+                # Wrong arguments for the method
+                raise ValueError("Line %d: %s" % (lineno + 1, e))
+            pending = True
+            if name == "cut":
+                self._end_job()
+                pending = False
+            elif len(self.encoder._buffer) >= CHUNK_SIZE:
+                # Long jobs are written while they are being encoded
+                self._put(self.encoder.output)
+                self.encoder.clear()
+        if pending:
+            self._end_job()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m escpos",
+        description="Send raw ESC/POS data, images or JSON jobs to a printer.")
+    parser.add_argument("inputs", nargs="*", metavar="FILE",
+                        help="input files, standard input if none or -")
+    parser.add_argument("-p", "--printer",
+                        help="network:HOST[:PORT], file:PATH, "
+                             "serial:DEVICE[:BAUDRATE] or usb:VENDOR:PRODUCT")
+    parser.add_argument("--profile", default="default",
+                        help="printer capability profile")
+    parser.add_argument("-f", "--format", default="auto",
+                        choices=("auto", "raw", "image", "json"),
+                        help="input format, guessed from the extension "
+                             "by default")
+    parser.add_argument("-n", "--repeat", type=int, default=1,
+                        help="send the input this many times")
+    parser.add_argument("--dry-run", metavar="PATH",
+                        help="write to a file instead of the printer")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="optimize image and JSON jobs before sending")
+    parser.add_argument("--encoding", default="cp437",
+                        help="encoding of the JSON text (default cp437)")
+    parser.add_argument("-t", "--timing", action="store_true",
+                        help="print a throughput summary on stderr")
+    args = parser.parse_args(argv)
+
+    if not args.printer and not args.dry_run:
+        parser.error("a printer (-p) or --dry-run is required")
+    inputs = args.inputs or ["-"]
+
+    spool = None
+    target = None
+    try:
+        if args.dry_run:
+            target = printer.File(args.dry_run, profile=args.profile)
+        else:
+            target = open_printer(args.printer, args.profile)
+        if "-" in inputs and args.repeat > 1:
+            # Standard input can only be read once
+            spool = tempfile.TemporaryFile()
+            shutil.copyfileobj(sys.stdin, spool, CHUNK_SIZE)
+
+        pipeline = Pipeline(target, args.profile, args.encoding,
+                            args.optimize)
+        start = time.time()
+        pipeline.start()
+        try:
+            for i in range(args.repeat):
+                for name in inputs:
+                    fmt = input_format(name, args.format)
+                    if name == "-":
+                        fd = sys.stdin
+                        if spool is not None:
+                            spool.seek(0)
+                            fd = spool
+                    elif fmt == "image":
+                        pipeline.image(name)
+                        continue
+                    else:
+                        fd = open(name, "rb")
+                    if fmt == "json":
+                        pipeline.json(fd)
+                    elif fmt == "image":
+                        # PIL reads the whole image anyway
+                        pipeline.image(fd)
+                    else:
+                        pipeline.raw(fd)
+                    if fd not in (sys.stdin, spool):
+                        fd.close()
+        finally:
+            pipeline.finish()
+        elapsed = time.time() - start
+    except (Error, ValueError, IOError, OSError), e:
+        sys.stderr.write("escpos: %s\n" % e)
+        return getattr(e, "resultcode", 1)
+    finally:
+        if target is not None:
+            # Release the device the way the with statement would
+            target.__exit__(None, None, None)
+        if spool is not None:
+            spool.close()
+
+    if args.timing:
+        elapsed = max(elapsed, 1e-6)
+        sys.stderr.write("%d bytes in %d jobs, %.3fs: %.0f bytes/s, "
+                         "%.1f jobs/s\n" % (pipeline.bytes, pipeline.jobs,
+                                            elapsed, pipeline.bytes / elapsed,
+                                            pipeline.jobs / elapsed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+""" ESC/POS Printer capability profiles """
+
+import json
+import os
+
+from exceptions import *
+
+# Data file shipped with the package
+PROFILES_FILE = os.path.join(os.path.dirname(__file__), "capabilities.json")
+
+_profiles = {}
+# Set once the data file shipped with the package has been read
+_builtin = False
+
+
+class Profile:
+    """ Capabilities of a printer model """
+
+    def __init__(self, key, data):
+        """
+        @param key  : Name used to look the profile up
+        @param data : Dictionary as stored in the capabilities data file
+        """
+        self.key = key
+        self.name = data.get("name", key)
+        # Printable width in dots at full density
+        self.media_width = int(data["media_width"])
+        # Dots per inch of the print head
+        self.dpi = int(data.get("dpi", 180))
+        # Characters per line for each built-in font
+        self.columns = dict((k.lower(), int(v))
+                            for k, v in data["columns"].items())
+        # Size of the receive buffer in bytes
+        self.buffer_size = int(data.get("buffer_size", 4096))
+        # Highest band that can be sent with a single GS v 0
+        self.raster_max_height = int(data.get("raster_max_height", 0))
+        # Bytes the macro buffer holds, 0 when GS : is not supported
+        self.macro_size = int(data.get("macro_size", 0))
+        self.features = dict(data.get("features", {}))
+
+    def supports(self, feature):
+        """ Tell if the printer handles a feature natively """
+        return bool(self.features.get(feature, False))
+
+    def __repr__(self):
+        return "<Profile %s>" % self.key
+
+
+def _read(fname):
+    fd = open(fname)
+    try:
+        data = json.load(fd)
+    finally:
+        fd.close()
+    for key, values in data.items():
+        _profiles[key] = Profile(key, values)
+
+
+def _load_builtin():
+    """ Read the data file shipped with the package, once """
+    global _builtin
+    if not _builtin:
+        _read(PROFILES_FILE)
+        _builtin = True
+
+
+def load_profiles(fname=PROFILES_FILE):
+    """ Read profiles from a JSON data file and add them to the registry.
+    Profiles already registered under the same name are replaced, own
+    models are added on top of the shipped ones.
+    @param fname : Path to the data file
+    """
+    _load_builtin()
+    _read(fname)
+
+
+def get_profile(name="default"):
+    """ Return the profile registered under name """
+    _load_builtin()
+    try:
+        return _profiles[name]
+    except KeyError:
+        raise ProfileNotFoundError(name)
+
+
+def list_profiles():
+    """ Return the names of all registered profiles """
+    _load_builtin()
+    return sorted(_profiles.keys())
@@ -1,53 +1,79 @@
 """ ESC/POS Commands (Constants) """
 
 # Feed control sequences
-CTL_LF    = '\x0a'             # Print and line feed
-CTL_FF    = '\x0c'             # Form feed
-CTL_CR    = '\x0d'             # Carriage return
-CTL_HT    = '\x09'             # Horizontal tab
-CTL_VT    = '\x0b'             # Vertical tab
+CTL_LF    = b'\x0a'            # Print and line feed
+CTL_FF    = b'\x0c'            # Form feed
+CTL_CR    = b'\x0d'            # Carriage return
+CTL_HT    = b'\x09'            # Horizontal tab
+CTL_VT    = b'\x0b'            # Vertical tab
+CTL_SPACING     = b'\x1b\x33'  # Line spacing, followed by n motion units
+CTL_SPACING_DEF = b'\x1b\x32'  # Default line spacing
 # Printer hardware
-HW_INIT   = '\x1b\x40'         # Clear data in buffer and reset modes
-HW_SELECT = '\x1b\x3d\x01'     # Printer select
-HW_RESET  = '\x1b\x3f\x0a\x00' # Reset printer hardware
+HW_INIT   = b'\x1b\x40'        # Clear data in buffer and reset modes
+HW_SELECT = b'\x1b\x3d\x01'    # Printer select
+HW_RESET  = b'\x1b\x3f\x0a\x00' # Reset printer hardware
 # Cash Drawer
-CD_KICK_2 = '\x1b\x70\x00\x19\xff'     # Sends a pulse to pin 2 [] 
-CD_KICK_5 = '\x1b\x70\x01\x19\xff'     # Sends a pulse to pin 5 [] 
+CD_KICK_2 = b'\x1b\x70\x00\x19\xff'    # Sends a pulse to pin 2 [] 
+CD_KICK_5 = b'\x1b\x70\x01\x19\xff'    # Sends a pulse to pin 5 [] 
+# Page mode
+PAGE_MODE       = b'\x1b\x4c'    # Select page mode
+PAGE_STANDARD   = b'\x1b\x53'    # Select standard mode, page data is discarded
+PAGE_AREA       = b'\x1b\x57'    # Print area, followed by xL xH yL yH dxL dxH dyL dyH
+PAGE_DIR_LT     = b'\x1b\x54\x00' # Left to right, starting top left
+PAGE_DIR_BT     = b'\x1b\x54\x01' # Bottom to top, starting bottom left
+PAGE_DIR_RT     = b'\x1b\x54\x02' # Right to left, starting bottom right
+PAGE_DIR_TB     = b'\x1b\x54\x03' # Top to bottom, starting top right
+PAGE_POS_X      = b'\x1b\x24'    # Absolute horizontal position, followed by nL nH
+PAGE_POS_Y      = b'\x1d\x24'    # Absolute vertical position, followed by nL nH
+PAGE_PRINT      = b'\x1b\x0c'    # Print the page and stay in page mode
+PAGE_CANCEL     = b'\x18'        # Delete the page data
+MOTION_UNITS    = b'\x1d\x50'    # Motion units, followed by x y (1/x and 1/y inch)
+# Macros
+MACRO_DEFINE    = b'\x1d\x3a'    # Start or end the macro definition
+MACRO_RUN       = b'\x1d\x5e'    # Execute the macro, followed by r t m
 # Paper
-PAPER_FULL_CUT  = '\x1d\x56\x00' # Full cut paper
-PAPER_PART_CUT  = '\x1d\x56\x01' # Partial cut paper
+PAPER_FULL_CUT  = b'\x1d\x56\x00' # Full cut paper
+PAPER_PART_CUT  = b'\x1d\x56\x01' # Partial cut paper
 # Text format   
-TXT_NORMAL      = '\x1b\x21\x00' # Normal text
-TXT_2HEIGHT     = '\x1b\x21\x10' # Double height text
-TXT_2WIDTH      = '\x1b\x21\x20' # Double width text
-TXT_UNDERL_OFF  = '\x1b\x2d\x00' # Underline font OFF
-TXT_UNDERL_ON   = '\x1b\x2d\x01' # Underline font 1-dot ON
-TXT_UNDERL2_ON  = '\x1b\x2d\x02' # Underline font 2-dot ON
-TXT_BOLD_OFF    = '\x1b\x45\x00' # Bold font OFF
-TXT_BOLD_ON     = '\x1b\x45\x01' # Bold font ON
-TXT_FONT_A      = '\x1b\x4d\x00' # Font type A
-TXT_FONT_B      = '\x1b\x4d\x01' # Font type B
-TXT_ALIGN_LT    = '\x1b\x61\x00' # Left justification
-TXT_ALIGN_CT    = '\x1b\x61\x01' # Centering
-TXT_ALIGN_RT    = '\x1b\x61\x02' # Right justification
+TXT_NORMAL      = b'\x1b\x21\x00' # Normal text
+TXT_2HEIGHT     = b'\x1b\x21\x10' # Double height text
+TXT_2WIDTH      = b'\x1b\x21\x20' # Double width text
+TXT_UNDERL_OFF  = b'\x1b\x2d\x00' # Underline font OFF
+TXT_UNDERL_ON   = b'\x1b\x2d\x01' # Underline font 1-dot ON
+TXT_UNDERL2_ON  = b'\x1b\x2d\x02' # Underline font 2-dot ON
+TXT_BOLD_OFF    = b'\x1b\x45\x00' # Bold font OFF
+TXT_BOLD_ON     = b'\x1b\x45\x01' # Bold font ON
+TXT_FONT_A      = b'\x1b\x4d\x00' # Font type A
+TXT_FONT_B      = b'\x1b\x4d\x01' # Font type B
+TXT_ALIGN_LT    = b'\x1b\x61\x00' # Left justification
+TXT_ALIGN_CT    = b'\x1b\x61\x01' # Centering
+TXT_ALIGN_RT    = b'\x1b\x61\x02' # Right justification
 # Barcode format
-BARCODE_TXT_OFF = '\x1d\x48\x00' # HRI barcode chars OFF
-BARCODE_TXT_ABV = '\x1d\x48\x01' # HRI barcode chars above
-BARCODE_TXT_BLW = '\x1d\x48\x02' # HRI barcode chars below
-BARCODE_TXT_BTH = '\x1d\x48\x03' # HRI barcode chars both above and below
-BARCODE_FONT_A  = '\x1d\x66\x00' # Font type A for HRI barcode chars
-BARCODE_FONT_B  = '\x1d\x66\x01' # Font type B for HRI barcode chars
-BARCODE_HEIGHT  = '\x1d\x68\x64' # Barcode Height [1-255]
-BARCODE_WIDTH   = '\x1d\x77\x03' # Barcode Width  [2-6]
-BARCODE_UPC_A   = '\x1d\x6b\x00' # Barcode type UPC-A
-BARCODE_UPC_E   = '\x1d\x6b\x01' # Barcode type UPC-E
-BARCODE_EAN13   = '\x1d\x6b\x02' # Barcode type EAN13
-BARCODE_EAN8    = '\x1d\x6b\x03' # Barcode type EAN8
-BARCODE_CODE39  = '\x1d\x6b\x04' # Barcode type CODE39
-BARCODE_ITF     = '\x1d\x6b\x05' # Barcode type ITF
-BARCODE_NW7     = '\x1d\x6b\x06' # Barcode type NW7
+BARCODE_TXT_OFF = b'\x1d\x48\x00' # HRI barcode chars OFF
+BARCODE_TXT_ABV = b'\x1d\x48\x01' # HRI barcode chars above
+BARCODE_TXT_BLW = b'\x1d\x48\x02' # HRI barcode chars below
+BARCODE_TXT_BTH = b'\x1d\x48\x03' # HRI barcode chars both above and below
+BARCODE_FONT_A  = b'\x1d\x66\x00' # Font type A for HRI barcode chars
+BARCODE_FONT_B  = b'\x1d\x66\x01' # Font type B for HRI barcode chars
+BARCODE_HEIGHT  = b'\x1d\x68\x64' # Barcode Height [1-255]
+BARCODE_WIDTH   = b'\x1d\x77\x03' # Barcode Width  [2-6]
+BARCODE_UPC_A   = b'\x1d\x6b\x00' # Barcode type UPC-A
+BARCODE_UPC_E   = b'\x1d\x6b\x01' # Barcode type UPC-E
+BARCODE_EAN13   = b'\x1d\x6b\x02' # Barcode type EAN13
+BARCODE_EAN8    = b'\x1d\x6b\x03' # Barcode type EAN8
+BARCODE_CODE39  = b'\x1d\x6b\x04' # Barcode type CODE39
+BARCODE_ITF     = b'\x1d\x6b\x05' # Barcode type ITF
+BARCODE_NW7     = b'\x1d\x6b\x06' # Barcode type NW7
 # Image format  
-S_RASTER_N      = '\x1d\x76\x30\x00' # Set raster image normal size
-S_RASTER_2W     = '\x1d\x76\x30\x01' # Set raster image double width
-S_RASTER_2H     = '\x1d\x76\x30\x02' # Set raster image double height
-S_RASTER_Q      = '\x1d\x76\x30\x03' # Set raster image quadruple
+S_RASTER_N      = b'\x1d\x76\x30\x00' # Set raster image normal size
+S_RASTER_2W     = b'\x1d\x76\x30\x01' # Set raster image double width
+S_RASTER_2H     = b'\x1d\x76\x30\x02' # Set raster image double height
+S_RASTER_Q      = b'\x1d\x76\x30\x03' # Set raster image quadruple
+S_BITIMG_8      = b'\x1b\x2a\x00'    # 8-dot single density bit image, followed by nL nH
+S_BITIMG_24     = b'\x1b\x2a\x21'    # 24-dot double density bit image, followed by nL nH
+# QR Code (GS ( k)
+QR_MODEL_2      = b'\x1d\x28\x6b\x04\x00\x31\x41\x32\x00' # Select model 2
+QR_SIZE         = b'\x1d\x28\x6b\x03\x00\x31\x43'        # Module size, followed by n [1-16]
+QR_ECC          = b'\x1d\x28\x6b\x03\x00\x31\x45'        # Error correction, followed by n [48-51]
+QR_STORE        = b'\x1d\x28\x6b'                        # Store data, followed by pL pH 0x31 0x50 0x30
+QR_PRINT        = b'\x1d\x28\x6b\x03\x00\x31\x51\x30'    # Print the stored symbol
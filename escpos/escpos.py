@@ -8,81 +8,51 @@
 
 from PIL import Image
 import qrcode
+import struct
 import time
 
+from capabilities import *
 from constants import *
 from exceptions import *
+from optimizer import tokenize
+from truetype import TrueTypeText
 
 class Escpos:
     """ ESC/POS Printer object """
     device = None
+    profile = None
+    pageMode = False
+    pagePos = (0, 0)
+    # Code page used for unicode text and the font for what it lacks
+    codepage = "cp437"
+    ttf = None
 
+    def __init__(self, profile="default"):
+        """
+        @param profile : Name of the printer profile or a Profile object
+        """
+        self.set_profile(profile)
+
+
+    def set_profile(self, profile="default"):
+        """ Configure paper and font widths from a printer profile """
+        if not isinstance(profile, Profile):
+            profile = get_profile(profile)
+        self.profile = profile
+        # ESC * counts pixels at single density, half the dots of the head
+        self.pxWidth = profile.media_width / 2
+        self.widthA = profile.columns["a"]
+        self.widthB = profile.columns.get("b", self.widthA)
+        self.width = self.widthA
 
-    def _printImgMatrix(self, imgMatrix, width, height, res, align):
-        """Print an image as a pixel access object with binary colour."""
-        if res == "high":
-            scaling = 24
-            currentpxWidth = self.pxWidth * 2
-        else:
-            scaling = 8
-            currentpxWidth = self.pxWidth
-        if width > currentpxWidth:
-            raise ValueError("Image too wide. Maximum width is configured to be " + str(currentpxWidth) + "pixels. The image is " + str(width) + " pixels wide.")
-        tmp = ''
-        for yScale in range(-(-height / scaling)):
-            # Set mode to hex and 8-dot single density (60 dpi).
-            if res == "high":
-                outList = ["0x1B", "0x2A", "0x21"]
-            else:
-                outList = ["0x1B", "0x2A", "0x00"]
-            # Add width to the communication to the printer.
-            # Depending on the alignment we count that in and add blank
-            # vertical lines to the outList
-            if align == "left":
-                blanks = 0
-            if align == "center":
-                blanks = (currentpxWidth - width) / 2
-            if align == "right":
-                blanks = currentpxWidth - width
-            highByte = (width + blanks) / 256
-            lowByte = (width + blanks) % 256
-            outList.append(hex(lowByte))
-            outList.append(hex(highByte))
-            if res == "high":
-                blanks *= 3
-            if align == "left":
-                pass
-            if align == "center":
-                for i in range(blanks):
-                    outList.append(hex(0))
-            if align == "right":
-                for i in range(blanks):
-                    outList.append(hex(0))
-            for x in range(width):
-                """Compute hex string for one vertical bar of 8 dots
-                (zero padded from the bottom if necessary).
-                """
-                binStr = ""
-                for y in range(scaling):
-                    """ Indirect zero padding.
-                    Do not try to extract values from images beyond its size.
-                    """
-                    if (yScale * scaling + y) < height:
-                        binStr += "0" if imgMatrix[x, yScale * scaling + y] == 255 else "1"
-                    # Zero padding
-                    else:
-                        binStr += "0"
-                outList.append(hex(int(binStr[0:8], 2)))
-                if res == "high":
-                    outList.append(hex(int(binStr[8:16], 2)))
-                    outList.append(hex(int(binStr[16:24], 2)))
-            for element in outList:
-                try:
-                    tmp += chr(int(element, 16))
-                except:
-                    raise
-
-        self.text(tmp)
+
+    def _send(self, buf):
+        """ Send a buffer in slices of the printer receive buffer, without
+        copying it """
+        view = memoryview(buf)
+        step = self.profile.buffer_size
+        for i in range(0, len(view), step):
+            self._raw(view[i:i + step])
 
 
     def _printImgFromPILObj(self, img, res="high", align="center", scale=None):
@@ -105,16 +75,105 @@ class Escpos:
             else:
                 # Convert to binary colour depth
                 imgB = img.convert("1")
-            # Convert to a pixel access object
-            imgMatrix = imgB.load()
-            width = imgB.size[0]
-            height = imgB.size[1]
             # Print it
-            self._printImgMatrix(imgMatrix, width, height, res, align)
+            self._printImg(imgB, res, align)
         except:
             raise
 
 
+    def _printImg(self, img, res, align):
+        """Print a binary colour PIL image with the fastest encoder
+        available on the printer."""
+        if self.pageMode:
+            self._printImgPage(img)
+        elif res == "high" and self.profile.supports("raster"):
+            self._printImgRaster(img, align)
+        else:
+            self._printImgColumns(img, res, align)
+
+
+    def _printImgColumns(self, img, res, align):
+        """Print a binary colour PIL image as ESC * bit image bands."""
+        if res == "high":
+            scaling = 24
+            currentpxWidth = self.pxWidth * 2
+            mode = S_BITIMG_24
+        else:
+            scaling = 8
+            currentpxWidth = self.pxWidth
+            mode = S_BITIMG_8
+        width, height = img.size
+        if width > currentpxWidth:
+            raise ValueError("Image too wide. Maximum width is configured to be " + str(currentpxWidth) + "pixels. The image is " + str(width) + " pixels wide.")
+        # Depending on the alignment add blank vertical lines on the left
+        if align == "center":
+            blanks = (currentpxWidth - width) / 2
+        elif align == "right":
+            blanks = currentpxWidth - width
+        else:
+            blanks = 0
+        header = mode + struct.pack("<H", width + blanks)
+        padding = bytearray(blanks * scaling / 8)
+        step = self.profile.buffer_size
+        # Every band ends its own line, and both densities are 24 dots of
+        # the print head tall, so the bands are fed without gaps
+        buf = bytearray(CTL_SPACING + b'\x18')
+        for top in range(0, height, scaling):
+            buf += header
+            buf += padding
+            buf += self._bitImageBand(img, top, scaling)
+            buf += CTL_LF
+            if len(buf) >= step:
+                self._send(buf)
+                buf = bytearray()
+        buf += CTL_SPACING_DEF
+        self._send(buf)
+
+
+    def _bitImageBand(self, img, top, scaling):
+        """Return the ESC * column data of one band of a binary colour
+        PIL image."""
+        width, height = img.size
+        if top + scaling <= height:
+            band = img.crop((0, top, width, top + scaling))
+        else:
+            # Zero padding from the bottom
+            band = Image.new("1", (width, scaling), 255)
+            band.paste(img.crop((0, top, width, height)), (0, 0))
+        # A row of the transposed band is a column of dots, and 1;I packs
+        # a printed (black) dot as 1
+        return band.transpose(Image.TRANSPOSE).tobytes("raw", "1;I")
+
+
+    def _printImgRaster(self, img, align):
+        """Print a binary colour PIL image as GS v 0 raster bands."""
+        width, height = img.size
+        maxWidth = self.pxWidth * 2
+        if width > maxWidth:
+            raise ValueError("Image too wide. Maximum width is configured to be " + str(maxWidth) + "pixels. The image is " + str(width) + " pixels wide.")
+        if align == "center":
+            blanks = (maxWidth - width) / 2
+        elif align == "right":
+            blanks = maxWidth - width
+        else:
+            blanks = 0
+        rowWidth = (blanks + width + 7) / 8 * 8
+        rowBytes = rowWidth / 8
+        band = self.profile.raster_max_height or height
+        for y in range(0, height, band):
+            rows = min(band, height - y)
+            if blanks == 0 and rowWidth == width:
+                canvas = img.crop((0, y, width, y + rows))
+            else:
+                # Pad every row to whole bytes with white so no stray
+                # dots are set
+                canvas = Image.new("1", (rowWidth, rows), 255)
+                canvas.paste(img.crop((0, y, width, y + rows)), (blanks, 0))
+            self._raw(S_RASTER_N + struct.pack("<HH", rowBytes, rows))
+            # 1;I packs a printed (black) dot as 1
+            self._send(canvas.tobytes("raw", "1;I"))
+
+
     def image(self, fname, res="high", align="center", scale=None):
         """Print an image from a file.
         resolution may be set to "high" or "low". Setting it to low makes
@@ -131,15 +190,47 @@ class Escpos:
             raise
 
 
+    def _printImgPage(self, img):
+        """Place a binary colour PIL image at the page mode print
+        position as 24-dot ESC * bands."""
+        x, y = self.pagePos
+        width, height = img.size
+        # Bit images sit with their bottom on the print position, like
+        # text; an image taller than that starts at the top of the area
+        first = max(y - height, 0) + 24
+        for top in range(0, height, 24):
+            self.page_position(x, first + top)
+            self._raw(S_BITIMG_24 + struct.pack("<H", width))
+            self._raw(self._bitImageBand(img, top, 24))
+        # The printer is left after the last band
+        self.pagePos = (x + width, self.pagePos[1])
+
+
     def qr(self, text):
         """ Print QR Code for the provided string """
+        if self.profile.supports("qr"):
+            self._qrNative(text)
+            return
         qr_code = qrcode.QRCode(version=4, box_size=4, border=1)
         qr_code.add_data(text)
         qr_code.make(fit=True)
         qr_img = qr_code.make_image()
         im = qr_img._img.convert("RGB")
         # Convert the RGB image in printable image
-        self._convert_image(im)
+        self._printImgFromPILObj(im)
+
+
+    def _qrNative(self, text, size=4):
+        """ Let the printer build the QR Code with GS ( k """
+        length = len(text) + 3
+        self._raw(TXT_ALIGN_CT)
+        self._raw(QR_MODEL_2)
+        self._raw(QR_SIZE + struct.pack("B", size))
+        # Error correction level M, as the bitmap fallback uses
+        self._raw(QR_ECC + b'\x31')
+        self._raw(QR_STORE + struct.pack("<H", length) + b'\x31\x50\x30')
+        self._raw(text)
+        self._raw(QR_PRINT)
 
 
     def barcode(self, code, bc, width, height, pos, font):
@@ -197,11 +288,47 @@ class Escpos:
     def text(self, txt):
         """ Print alpha-numeric text """
         if txt:
-            self._raw(txt)
+            if isinstance(txt, unicode):
+                self._textUnicode(txt)
+            else:
+                self._raw(txt)
         else:
             raise TextError()
 
 
+    def set_ttf(self, font, size=24, capacity=1024):
+        """ Print unicode lines the code page can not encode as images
+        rendered with a TrueType font. Pass None to disable.
+        @param font     : Path of the TrueType font
+        @param size     : Font size in dots
+        @param capacity : Number of glyphs kept in memory
+        """
+        if font is None:
+            self.ttf = None
+        else:
+            self.ttf = TrueTypeText(font, size, capacity)
+
+
+    def _textUnicode(self, txt):
+        """ Send unicode text, line by line, as native text when the code
+        page has every character and as a TrueType bitmap otherwise """
+        for line in txt.splitlines(True):
+            try:
+                self._raw(line.encode(self.codepage))
+                continue
+            except UnicodeEncodeError:
+                if self.ttf is None:
+                    self._raw(line.encode(self.codepage, "replace"))
+                    continue
+            body = line.rstrip(u"\r\n")
+            if not body:
+                continue
+            # GS v 0 and the ESC * bands both end their line, so the
+            # newline is dropped
+            img = self.ttf.render(body, self.profile.media_width)
+            self._printImg(img, "high", "left")
+
+
     def set(self, align='left', font='a', type='normal', width=1, height=1):
         """ Set text properties """
         # Width
@@ -254,7 +381,7 @@ class Escpos:
         """ Cut paper """
         # Fix the size between last line and cut
         # TODO: handle this with a line feed
-        self._raw("\n\n\n\n\n\n")
+        self._raw(CTL_LF * 6)
         if mode.upper() == "PART":
             self._raw(PAPER_PART_CUT)
         else:  # DEFAULT MODE: FULL CUT
@@ -275,6 +402,7 @@ class Escpos:
         """ Hardware operations """
         if hw.upper() == "INIT":
             self._raw(HW_INIT)
+            self.pageMode = False
         elif hw.upper() == "SELECT":
             self._raw(HW_SELECT)
         elif hw.upper() == "RESET":
@@ -289,14 +417,137 @@ class Escpos:
             self._raw(CTL_LF)
         elif ctl.upper() == "FF":
             self._raw(CTL_FF)
+            self.pageMode = False
         elif ctl.upper() == "CR":
             self._raw(CTL_CR)
         elif ctl.upper() == "HT":
             self._raw(CTL_HT)
         elif ctl.upper() == "VT":
             self._raw(CTL_VT)
-            
-            
+
+
+    def page_mode(self, height, width=None, x=0, y=0, direction="LT"):
+        """ Enter page mode and set the print area.
+        Coordinates are given in dots from the top left corner of the
+        page. direction may be "LT", "BT", "RT" or "TB", see ESC T.
+        """
+        if width is None:
+            width = self.profile.media_width - x
+        if direction.upper() == "LT":
+            dirCmd = PAGE_DIR_LT
+        elif direction.upper() == "BT":
+            dirCmd = PAGE_DIR_BT
+        elif direction.upper() == "RT":
+            dirCmd = PAGE_DIR_RT
+        elif direction.upper() == "TB":
+            dirCmd = PAGE_DIR_TB
+        else:
+            raise ValueError("Page direction must be LT, BT, RT or TB")
+        self._raw(PAGE_MODE)
+        # Make one motion unit match one dot of the print head
+        self._raw(MOTION_UNITS + struct.pack("BB", self.profile.dpi, self.profile.dpi))
+        self._raw(PAGE_AREA + struct.pack("<HHHH", x, y, width, height))
+        self._raw(dirCmd)
+        self.pageMode = True
+        self.pagePos = (0, 0)
+
+
+    def page_position(self, x=None, y=None):
+        """ Move the page mode print position, in dots inside the print
+        area. Text, barcodes and images are placed with their bottom on y.
+        """
+        if x is not None:
+            self._raw(PAGE_POS_X + struct.pack("<H", x))
+        if y is not None:
+            self._raw(PAGE_POS_Y + struct.pack("<H", y))
+        curX, curY = self.pagePos
+        self.pagePos = (curX if x is None else x, curY if y is None else y)
+
+
+    def page_print(self, keep=False):
+        """ Print the page as composed. The printer goes back to standard
+        mode unless keep is set, then the page can be reused. """
+        if keep:
+            self._raw(PAGE_PRINT)
+        else:
+            self._raw(CTL_FF)
+            self.pageMode = False
+
+
+    def page_cancel(self):
+        """ Discard the page and go back to standard mode """
+        self._raw(PAGE_CANCEL)
+        self._raw(PAGE_STANDARD)
+        self.pageMode = False
+
+
+    def macro(self, copies=1, delay=0):
+        """ Record a job and print it from a printer macro, so the bytes
+        go over the wire once whatever the number of copies:
+
+          with Epson.macro(copies=50, delay=0.5) as label:
+              label.text("SKU 0042\\n")
+              label.cut()
+
+        @param copies : Number of times the job is printed
+        @param delay  : Seconds the printer waits before each copy,
+                        in steps of 0.1 up to 25.5
+        """
+        if copies < 1:
+            raise MacroError("At least one copy must be printed")
+        self._macroCommand(1, delay)
+        return _Macro(self, copies, delay)
+
+
+    def run_macro(self, times=1, delay=0):
+        """ Execute the macro stored on the printer again
+        @param times : Number of executions
+        @param delay : Seconds waited before each execution
+        """
+        self._raw(self._macroCommand(times, delay))
+
+
+    def _macroCommand(self, times, delay):
+        """ Return the GS ^ commands executing the macro times times """
+        wait = int(round(delay * 10))
+        if times < 1 or not 0 <= wait <= 255:
+            raise MacroError("Macro delay must be between 0 and 25.5s")
+        cmds = []
+        while times > 0:
+            # GS ^ takes up to 255 executions
+            count = min(times, 255)
+            cmds.append(MACRO_RUN + struct.pack("BBB", count, wait, 0))
+            times -= count
+        return b"".join(cmds)
+
+
+    def _printMacro(self, job, copies, delay):
+        """ Print a recorded job copies times. The longest run of whole
+        commands fitting the macro buffer is defined once and executed
+        for every copy, the rest of the job is sent with each copy.
+        """
+        start, end = 0, 0
+        if copies > 1 and self.profile.macro_size:
+            start, end = _macroWindow(job, self.profile.macro_size)
+        if start == end:
+            # No macro buffer or nothing fits in it
+            for i in range(copies):
+                self._send(job)
+            return
+        buf = bytearray(MACRO_DEFINE)
+        buf += job[start:end]
+        buf += MACRO_DEFINE
+        if start == 0 and end == len(job):
+            buf += self._macroCommand(copies, delay)
+        else:
+            run = self._macroCommand(1, delay)
+            for i in range(copies):
+                buf += job[:start]
+                buf += run
+                buf += job[end:]
+        self._send(buf)
+
+
     # Helper functions to facilitate printing
     def format_date(self, date):
         string = str(date['date']) + '/' + str(date['month']) + '/' + str(date['year']) + ' ' + str(date['hour']) + ':' + "%02d" % date['minute']
@@ -308,47 +559,42 @@ class Escpos:
         (e.g. a price on a receipt). Be aware that when rcolstr is
         used newline(s) may only be a part of rcolstr, and only as
         the last character(s)."""
+        blanks = 0
         if align != "left" and len(string) < self.width:
-            blanks = 0
             if align == "right":
-                blanks = self.width - len(string.rstrip("\n"))
+                blanks = self.width - len(string.rstrip(b"\n"))
             if align == "center":
-                blanks = (self.width - len(string.rstrip("\n"))) / 2
-            string = " " * blanks + string
+                blanks = (self.width - len(string.rstrip(b"\n"))) / 2
     
         if not rcolstr:
             try:
-                self.text(string)
+                self.text(b" " * blanks + string)
             except:
                 logger.error('No pude escribir', exc_info=1)
                 raise
         else:
-            rcolStrRstripNewline = rcolstr.rstrip("\n")
-            if "\n" in string or "\n" in rcolStrRstripNewline:
+            rcolStrRstripNewline = rcolstr.rstrip(b"\n")
+            if b"\n" in string or b"\n" in rcolStrRstripNewline:
                 raise ValueError("When using rcolstr in POSprinter.write only newline at the end of rcolstr is allowed and not in string (the main text string) it self.")
-            # expand string
-            lastLineLen = len(string) % self.width + len(rcolStrRstripNewline)
+            # expand string, the padding is only joined once at the end
+            length = blanks + len(string)
+            fill = 0
+            lastLineLen = length % self.width + len(rcolStrRstripNewline)
             if lastLineLen > self.width:
-                numOfBlanks = (self.width - lastLineLen) % self.width
-                string += numOfBlanks * " "
-                lastLineLen = len(string) % self.width + len(rcolStrRstripNewline)
+                fill = (self.width - lastLineLen) % self.width
+                lastLineLen = (length + fill) % self.width + len(rcolStrRstripNewline)
             if lastLineLen < self.width:
-                numOfBlanks = self.width - lastLineLen
-                string += " " * numOfBlanks
+                fill += self.width - lastLineLen
             try:
-                self.text(string + rcolstr)
+                self.text(b"".join([b" " * blanks, string, b" " * fill, rcolstr]))
             except:
                 logger.error('No pude escribir', exc_info=1)
                 raise
     
     def lineFeed(self, times=1, cut=False):
         """Write newlines and optional cut paper"""
-        while times:
-            try:
-                self.text("\n")
-            except:
-                raise
-            times -= 1
+        if times:
+            self._raw(CTL_LF * times)
         if cut:
             try:
                 self.cut('part')
@@ -364,17 +610,17 @@ class Escpos:
     
     def font(self, font='a'):
         if font == 'a':
-            self._raw('\x1b\x4d\x01')
+            self._raw(b'\x1b\x4d\x01')
             self.width = self.widthA
         else:
-            self._raw('\x1b\x4d\x00')
+            self._raw(b'\x1b\x4d\x00')
             self.width = self.widthB
     
     def bold(self, bold=True):
         if bold:
-            self._raw('\x1b\x45\x01')
+            self._raw(b'\x1b\x45\x01')
         else:
-            self._raw('\x1b\x45\x00')
+            self._raw(b'\x1b\x45\x00')
     
     def decimal(self, number):
         return "%0.2f" % float(number)
@@ -411,71 +657,58 @@ class Escpos:
             else:
                 # Convert to binary colour depth
                 imgObjectB = imgObject.convert("1")
-            # Convert to a pixel access object
-            imgMatrix = imgObjectB.load()
-            width = imgObjectB.size[0]
-            height = imgObjectB.size[1]
             # Print it
-            self._printImgMatrix(imgMatrix, width, height, resolution, align)
+            self._printImg(imgObjectB, resolution, align)
         except:
             raise
-    
-    def _printImgMatrix(self, imgMatrix, width, height, resolution, align):
-            """Print an image as a pixel access object with binary colour."""
-            if resolution == "high":
-                scaling = 24
-                currentpxWidth = self.pxWidth * 2
-            else:
-                scaling = 8
-                currentpxWidth = self.pxWidth
-            if width > currentpxWidth:
-                raise ValueError("Image too wide. Maximum width is configured to be " + str(currentpxWidth) + "pixels. The image is " + str(width) + " pixels wide.")
-            tmp = ''
-            for yScale in range(-(-height / scaling)):
-                # Set mode to hex and 8-dot single density (60 dpi).
-                if resolution == "high":
-                    outList = [ "0x1B", "0x2A", "0x21" ]
-                else:
-                    outList = [ "0x1B", "0x2A", "0x00" ]
-                # Add width to the communication to the printer. Depending on the alignment we count that in and add blank vertical lines to the outList
-                if align == "left":
-                    blanks = 0
-                if align == "center":
-                    blanks = (currentpxWidth - width) / 2
-                if align == "right":
-                    blanks = currentpxWidth - width
-                highByte = (width + blanks) / 256
-                lowByte = (width + blanks) % 256
-                outList.append(hex(lowByte))
-                outList.append(hex(highByte))
-                if resolution == "high":
-                    blanks *= 3
-                if align == "left":
-                    pass
-                if align == "center":
-                    for i in range(blanks):
-                        outList.append(hex(0))
-                if align == "right":
-                    for i in range(blanks):
-                        outList.append(hex(0))
-                for x in range(width):
-                    # Compute hex string for one vertical bar of 8 dots (zero padded from the bottom if necessary).
-                    binStr = ""
-                    for y in range(scaling):
-                        # Indirect zero padding. Do not try to extract values from images beyond its size.
-                        if (yScale * scaling + y) < height:
-                            binStr += "0" if imgMatrix[x, yScale * scaling + y] == 255 else "1"
-                        # Zero padding
-                        else:
-                            binStr += "0"
-                    outList.append(hex(int(binStr[0:8], 2)))
-                    if resolution == "high":
-                        outList.append(hex(int(binStr[8:16], 2)))
-                        outList.append(hex(int(binStr[16:24], 2)))
-                for element in outList:
-                    try:
-                        tmp += chr(int(element, 16))
-                    except:
-                        raise
-    
-            self.write(tmp)
+
+
+def _macroWindow(job, size):
+    """ Return the start and end offsets of the longest run of whole
+    commands of a job that fits in size bytes """
+    pieces = []
+    for kind, data, key, arg in tokenize(job):
+        if kind == "text":
+            # Text may be cut anywhere
+            pieces.extend((data[i:i + size], True)
+                          for i in range(0, len(data), size))
+        else:
+            # Unknown data and macro commands are never stored
+            pieces.append((data, kind != "raw" and
+                           data[:2] not in (MACRO_DEFINE, MACRO_RUN)))
+    best = (0, 0)
+    start = end = 0
+    first = 0
+    for i, (data, storable) in enumerate(pieces):
+        end += len(data)
+        if not storable:
+            start, first = end, i + 1
+            continue
+        while end - start > size:
+            start += len(pieces[first][0])
+            first += 1
+        if end - start > best[1] - best[0]:
+            best = (start, end)
+    return best
+
+
+class _Macro:
+    """ Context manager returned by Escpos.macro() """
+
+    def __init__(self, printer, copies, delay):
+        # Imported here, printer imports this module
+        from printer import Dummy
+        self.printer = printer
+        self.copies = copies
+        self.delay = delay
+        self.buffer = Dummy(printer.profile)
+        self.buffer.codepage = printer.codepage
+        self.buffer.ttf = printer.ttf
+
+    def __enter__(self):
+        return self.buffer
+
+    def __exit__(self, exc, val, trace):
+        if exc is not None:
+            return
+        self.printer._printMacro(self.buffer.output, self.copies, self.delay)
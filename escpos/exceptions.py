@@ -22,6 +22,9 @@ class Error(Exception):
 # 40 = Image height is too large
 # 50 = No string supplied to be printed
 # 60 = Invalid pin to send Cash Drawer pulse
+# 70 = Printer profile not found
+# 80 = No printer of a pool is available
+# 90 = Invalid macro repeat count or delay
 
 
 class BarcodeTypeError(Error):
@@ -78,3 +81,33 @@ class CashDrawerError(Error):
 
     def __str__(self):
         return "Valid pin must be set to send pulse"
+
+
+class ProfileNotFoundError(Error):
+    def __init__(self, msg=""):
+        Error.__init__(self, msg)
+        self.msg = msg
+        self.resultcode = 70
+
+    def __str__(self):
+        return "Printer profile %s is not defined" % self.msg
+
+
+class PoolError(Error):
+    def __init__(self, msg=""):
+        Error.__init__(self, msg)
+        self.msg = msg
+        self.resultcode = 80
+
+    def __str__(self):
+        return self.msg or "No printer of the pool is available"
+
+
+class MacroError(Error):
+    def __init__(self, msg=""):
+        Error.__init__(self, msg)
+        self.msg = msg
+        self.resultcode = 90
+
+    def __str__(self):
+        return self.msg or "Macro can not be recorded"
@@ -0,0 +1,365 @@
+""" ESC/POS command stream optimizer
+
+Rewrites an assembled job into a shorter one that prints the same:
+
+  * runs of LF become ESC d n
+  * the lines cut() feeds before GS V become GS V 65/66 0, which feeds
+    the paper to the cutter; longer feeds keep their excess lines
+  * mode settings overridden before anything is printed are dropped,
+    as well as settings that do not change the current value
+  * trailing spaces at the end of a line are removed when they can not
+    be seen (no underline, reverse or upside-down printing, single
+    height, left justification, standard mode); a line is never left
+    empty, so its height does not change
+
+Unknown commands stop the optimization, the rest of the stream is sent
+untouched. Trailing spaces are checked assuming the printer starts from
+its power-on state, as after ESC @.
+"""
+
+from capabilities import *
+
+ESC = b'\x1b'
+GS = b'\x1d'
+FS = b'\x1c'
+DLE = b'\x10'
+LF = b'\x0a'
+NUL = b'\x00'
+
+# Number of parameter bytes of fixed length commands
+_ARGS = {
+    ESC: {' ': 1, '!': 1, '$': 2, '%': 1, '-': 1, '2': 0, '3': 1, '<': 0,
+          '=': 1, '?': 1, '@': 0, 'E': 1, 'G': 1, 'J': 1, 'L': 0, 'M': 1,
+          'R': 1, 'S': 0, 'T': 1, 'U': 1, 'V': 1, 'W': 8, '\\': 2, 'a': 1,
+          'c': 2, 'd': 1, 'e': 1, 'i': 0, 'm': 0, 'p': 3, 'r': 1, 't': 1,
+          '{': 1, '\x0c': 0},
+    GS: {'!': 1, '$': 2, '/': 1, ':': 0, 'B': 1, 'H': 1, 'I': 1, 'L': 2,
+         'P': 2, 'W': 2, '\\': 2, '^': 3, 'a': 1, 'b': 1, 'f': 1, 'h': 1,
+         'r': 1, 'w': 1},
+    FS: {'!': 1, '&': 0, '-': 1, '.': 0, 'C': 1, 'p': 2},
+    DLE: {'\x04': 1, '\x05': 1, '\x14': 3},
+}
+
+# Commands that only change the printer state, mapped to the state
+# they hold. ESC 2 and ESC 3 both set the line spacing.
+_SETTINGS = {
+    ESC + ' ': ESC + ' ', ESC + '!': ESC + '!', ESC + '-': ESC + '-',
+    ESC + '2': ESC + '3', ESC + '3': ESC + '3', ESC + 'E': ESC + 'E',
+    ESC + 'G': ESC + 'G', ESC + 'M': ESC + 'M', ESC + 'R': ESC + 'R',
+    ESC + 'V': ESC + 'V', ESC + 'a': ESC + 'a', ESC + 't': ESC + 't',
+    ESC + '{': ESC + '{', GS + '!': GS + '!', GS + 'B': GS + 'B',
+    GS + 'H': GS + 'H', GS + 'L': GS + 'L', GS + 'W': GS + 'W',
+    GS + 'b': GS + 'b', GS + 'f': GS + 'f', GS + 'h': GS + 'h',
+    GS + 'w': GS + 'w',
+}
+
+# ESC ! shares its bits with the dedicated commands
+_OVERLAPS = {
+    ESC + '!': (ESC + 'E', ESC + '-', ESC + 'M', GS + '!'),
+    ESC + 'E': (ESC + '!',),
+    ESC + '-': (ESC + '!',),
+    ESC + 'M': (ESC + '!',),
+    GS + '!': (ESC + '!',),
+}
+
+# Values after ESC @
+_DEFAULTS = {
+    ESC + ' ': NUL, ESC + '!': NUL, ESC + '-': NUL, ESC + 'E': NUL,
+    ESC + 'G': NUL, ESC + 'M': NUL, ESC + 'V': NUL, ESC + 'a': NUL,
+    ESC + '{': NUL, GS + '!': NUL, GS + 'B': NUL,
+}
+
+# Lines cut() feeds to bring the last printed line past the cutter,
+# taken as the paper GS V 65/66 feeds before cutting
+CUT_LINES = 6
+
+# Full and partial cut without feed, and their feeding variant
+_CUTS = {'\x00': 'A', '\x30': 'A', '\x01': 'B', '\x31': 'B'}
+
+
+def tokenize(data):
+    """ Split a command stream into (kind, bytes, key, arg) tuples.
+    kind is one of text, lf, set, feed, cut, init, cmd or raw; raw holds
+    everything from the first command that could not be parsed.
+    """
+    tokens = []
+    i = 0
+    size = len(data)
+    while i < size:
+        c = data[i]
+        if c == LF:
+            tokens.append(("lf", c, None, None))
+            i += 1
+            continue
+        if c >= ' ':
+            j = i + 1
+            while j < size and data[j] >= ' ':
+                j += 1
+            tokens.append(("text", data[i:j], None, None))
+            i = j
+            continue
+        if c not in _ARGS:
+            # HT, CR, FF and friends
+            tokens.append(("cmd", c, None, None))
+            i += 1
+            continue
+        end = _command_end(data, i)
+        if end is None or end > size:
+            tokens.append(("raw", data[i:], None, None))
+            break
+        cmd = data[i:end]
+        key = cmd[:2]
+        if key in _SETTINGS:
+            tokens.append(("set", cmd, _SETTINGS[key], cmd[2:]))
+        elif key == ESC + '@':
+            tokens.append(("init", cmd, None, None))
+        elif key == ESC + 'd' and cmd[2] != NUL:
+            tokens.append(("feed", cmd, None, ord(cmd[2])))
+        elif key == GS + 'V' and cmd[2] in _CUTS:
+            tokens.append(("cut", cmd, None, _CUTS[cmd[2]]))
+        else:
+            tokens.append(("cmd", cmd, None, None))
+        i = end
+    return tokens
+
+
+def _command_end(data, i):
+    """ Return the offset right after the command starting at i, or None
+    if the command is unknown """
+    if i + 1 >= len(data):
+        return None
+    prefix = data[i]
+    name = data[i + 1]
+    start = i + 2
+    args = _ARGS[prefix].get(name)
+    if args is not None:
+        return start + args
+    try:
+        if prefix == ESC and name == '*':
+            # ESC * m nL nH d1...dk
+            m = ord(data[start])
+            k = ord(data[start + 1]) + ord(data[start + 2]) * 256
+            return start + 3 + (k if m in (0, 1) else k * 3)
+        if prefix == GS and name == 'v' and data[start] == '0':
+            # GS v 0 m xL xH yL yH d1...dk
+            x = ord(data[start + 2]) + ord(data[start + 3]) * 256
+            y = ord(data[start + 4]) + ord(data[start + 5]) * 256
+            return start + 6 + x * y
+        if prefix == GS and name == '*':
+            return start + 2 + ord(data[start]) * ord(data[start + 1]) * 8
+        if prefix in (ESC, GS) and name == '(':
+            # ESC ( fn pL pH / GS ( fn pL pH, followed by the parameters
+            p = ord(data[start + 1]) + ord(data[start + 2]) * 256
+            return start + 3 + p
+        if prefix == GS and name == 'V':
+            return start + (2 if ord(data[start]) >= 65 else 1)
+        if prefix == GS and name == 'k':
+            m = ord(data[start])
+            if m <= 6:
+                return data.index(NUL, start + 1) + 1
+            return start + 2 + ord(data[start + 1])
+    except (IndexError, ValueError):
+        return None
+    return None
+
+
+class Optimizer:
+    """ Peephole optimizer for ESC/POS command streams """
+
+    def __init__(self, profile=None, cut_feed=True):
+        """
+        @param profile  : Printer profile, used for the line width
+        @param cut_feed : Replace the feed before a cut by GS V 65/66
+        """
+        if profile is None:
+            profile = get_profile()
+        elif not isinstance(profile, Profile):
+            profile = get_profile(profile)
+        self.profile = profile
+        self.cut_feed = cut_feed
+
+    def optimize(self, data):
+        """ Return the optimized stream and the number of bytes saved """
+        self._out = []
+        self._pending = []
+        self._state = {}
+        self._feed = 0
+        self._feedDirty = False
+        self._dirty = False
+        self._reset_attrs()
+        self._reset_line()
+        for token in tokenize(data):
+            kind = token[0]
+            if kind == "set":
+                self._flush_feed()
+                self._track(token)
+                self._pending.append(token)
+            elif kind in ("lf", "feed"):
+                if kind == "lf":
+                    self._strip_line()
+                self._flush_settings()
+                if not self._feed:
+                    self._feedDirty = self._dirty
+                self._feed += 1 if kind == "lf" else token[3]
+                self._dirty = False
+                self._reset_line()
+            elif kind == "cut" and self.cut_feed and self._feed - \
+                    self._feedDirty >= CUT_LINES:
+                # The line feed ending a printed line stays, so does the
+                # paper asked for on top of the cutter distance
+                self._flush_settings()
+                self._feed -= CUT_LINES
+                self._flush_feed()
+                self._out.append(GS + 'V' + token[3] + NUL)
+            else:
+                self._flush_settings()
+                self._flush_feed()
+                self._out.append(token[1])
+                if kind == "text":
+                    self._lineLen += len(token[1])
+                    self._lastText = len(self._out) - 1
+                    self._lastVisible = self._visible_spaces()
+                    self._dirty = True
+                elif kind == "init":
+                    self._state = dict(_DEFAULTS)
+                    self._reset_attrs()
+                    self._reset_line()
+                    self._dirty = False
+                elif kind == "cut":
+                    self._reset_line()
+                    self._dirty = False
+                else:
+                    if token[1] == ESC + 'L':
+                        self._page = True
+                    elif token[1] in ('\x0c', ESC + 'S'):
+                        self._page = False
+                    self._lineSafe = False
+                    self._dirty = True
+        self._flush_settings()
+        self._flush_feed()
+        result = ''.join(self._out)
+        return result, len(data) - len(result)
+
+    def _reset_attrs(self):
+        self._font = 0
+        self._wmul = 1
+        self._hmul = 1
+        self._underline = False
+        self._reverse = False
+        self._upsideDown = False
+        self._rotated = False
+        self._align = 0
+        self._spacing = 0
+        self._area = False
+        self._page = False
+
+    def _reset_line(self):
+        self._lineLen = 0
+        self._lineSafe = True
+        self._lastText = None
+        self._lastVisible = True
+
+    def _track(self, token):
+        """ Follow the attributes that decide if spaces can be seen """
+        key = token[2]
+        n = ord(token[3][:1] or NUL)
+        if key in (ESC + '!', ESC + 'M', GS + '!', ESC + ' ') \
+                and self._lineLen:
+            # The width of the line can no longer be known
+            self._lineSafe = False
+        if key == ESC + '!':
+            self._font = n & 1
+            self._hmul = 2 if n & 0x10 else 1
+            self._wmul = 2 if n & 0x20 else 1
+            self._underline = bool(n & 0x80)
+        elif key == ESC + '-':
+            self._underline = bool(n & 3)
+        elif key == ESC + 'M':
+            self._font = n & 3
+        elif key == GS + '!':
+            self._wmul = ((n >> 4) & 7) + 1
+            self._hmul = (n & 7) + 1
+        elif key == GS + 'B':
+            self._reverse = bool(n & 1)
+        elif key == ESC + '{':
+            self._upsideDown = bool(n & 1)
+        elif key == ESC + 'V':
+            self._rotated = bool(n & 3)
+        elif key == ESC + 'a':
+            self._align = n & 3
+        elif key == ESC + ' ':
+            self._spacing = n
+        elif key in (GS + 'L', GS + 'W'):
+            self._area = True
+
+    def _visible_spaces(self):
+        return (self._underline or self._reverse or self._upsideDown
+                or self._hmul > 1 or self._rotated or self._align != 0 or self._spacing != 0
+                or self._area or self._page)
+
+    def _strip_line(self):
+        """ Drop the trailing spaces of the line about to be printed """
+        if self._lastText is None or not self._lineSafe \
+                or self._lastVisible:
+            return
+        if self._lastText != len(self._out) - 1:
+            return
+        try:
+            columns = self.profile.columns["ab"[self._font]] / self._wmul
+        except (IndexError, KeyError):
+            return
+        text = self._out[-1]
+        spaces = len(text) - len(text.rstrip(' '))
+        # Keep the spaces that complete a line the printer wraps itself,
+        # and at least one character on its last row
+        keep = (self._lineLen - 1) / columns * columns + 1
+        remove = min(spaces, self._lineLen - keep)
+        if remove > 0:
+            self._out[-1] = text[:len(text) - remove]
+            self._lineLen -= remove
+
+    def _flush_settings(self):
+        """ Emit the settings collected since the last printed data """
+        pending = self._pending
+        self._pending = []
+        for i, token in enumerate(pending):
+            key, arg = token[2], token[3]
+            # Overridden before anything could use it
+            if [t for t in pending[i + 1:] if t[2] == key]:
+                continue
+            if self._state.get(key) == arg:
+                continue
+            self._out.append(token[1])
+            self._state[key] = arg
+            for other in _OVERLAPS.get(key, ()):
+                self._state.pop(other, None)
+
+    def _flush_feed(self):
+        """ Emit the line feeds collected so far """
+        n = self._feed
+        self._feed = 0
+        if n <= 3:
+            self._out.append(LF * n)
+            return
+        while n:
+            step = min(n, 255)
+            self._out.append(ESC + 'd' + chr(step))
+            n -= step
+
+
+def optimize(data, profile=None, cut_feed=True):
+    """ Optimize a command stream.
+    Return the new stream and the number of bytes saved.
+    """
+    return Optimizer(profile, cut_feed).optimize(data)
+
+
+def check(data, profile=None, cut_feed=True):
+    """ Tell if the optimized stream prints exactly like the original one,
+    by rendering both """
+    # Imported here, render imports this module
+    from render import Renderer
+    renderer = Renderer(profile)
+    before = renderer.render(data)
+    after = renderer.render(optimize(data, profile, cut_feed)[0])
+    return before.size == after.size and before.tobytes() == after.tobytes()
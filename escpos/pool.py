@@ -0,0 +1,181 @@
+""" Groups of identical printers sharing the load """
+
+import collections
+import threading
+import time
+
+from exceptions import *
+
+
+class Member:
+    """ Printer of a pool and its health figures """
+
+    def __init__(self, printer, window=10):
+        """
+        @param printer : Any Escpos backend
+        @param window  : Number of writes kept to average the latency
+        """
+        self.printer = printer
+        # Bytes handed to the printer and not written yet
+        self.inflight = 0
+        self.latencies = collections.deque(maxlen=window)
+        self.failures = 0
+        # Time after which a failing printer is tried again
+        self.retry_at = None
+        # Held for a whole job so jobs never interleave on the printer
+        self.lock = threading.Lock()
+
+    def latency(self):
+        """ Average time of the recent writes, in seconds """
+        if not self.latencies:
+            return 0.0
+        return sum(self.latencies) / len(self.latencies)
+
+    def healthy(self, now):
+        return self.retry_at is None or now >= self.retry_at
+
+    def __repr__(self):
+        return "<Member %r inflight=%d latency=%.3f failures=%d>" % (
+            self.printer, self.inflight, self.latency(), self.failures)
+
+
+class Pool:
+    """ Dispatch jobs to the least loaded printer of a group """
+
+    def __init__(self, printers, retry_delay=30.0, window=10, timeout=10.0):
+        """
+        @param printers    : Backends of identical printers
+        @param retry_delay : Seconds a failing printer is left out
+        @param window      : Number of writes kept to average the latency
+        @param timeout     : Seconds a network or serial write may block
+                             before the printer counts as failing
+        """
+        if not printers:
+            raise PoolError("Empty printer pool")
+        self.members = [Member(p, window) for p in printers]
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        for member in self.members:
+            self._set_timeout(member.printer)
+
+    def _candidates(self):
+        """ Healthy members, least loaded first """
+        now = time.time()
+        members = [m for m in self.members if m.healthy(now)]
+        members.sort(key=lambda m: (m.inflight, m.latency()))
+        return members
+
+    def _write(self, member, job):
+        """ Send a job to one member and update its figures.
+        Return True on success.
+        """
+        with self._lock:
+            # Counted from now on, so jobs waiting for the member
+            # make it look busy to the next ones
+            member.inflight += len(job)
+        try:
+            with member.lock:
+                start = time.time()
+                if member.retry_at is not None:
+                    self._reopen(member.printer)
+                member.printer._send(job)
+                elapsed = time.time() - start
+        except Exception:
+            with self._lock:
+                member.inflight -= len(job)
+                member.failures += 1
+                member.retry_at = time.time() + self.retry_delay
+            return False
+        with self._lock:
+            member.inflight -= len(job)
+            member.latencies.append(elapsed)
+            member.failures = 0
+            member.retry_at = None
+        return True
+
+    def _reopen(self, printer):
+        """ Give a failed printer a fresh connection """
+        try:
+            printer.__exit__(None, None, None)
+        except Exception:
+            # A broken connection may fail to close as well
+            pass
+        printer.open()
+        self._set_timeout(printer)
+
+    def _set_timeout(self, printer):
+        """ Make a jammed printer that stops reading fail its write
+        instead of blocking the member forever """
+        device = printer.device
+        if hasattr(device, "settimeout"):
+            # Network, kept for the sockets of later reopens
+            printer.timeout = self.timeout
+            device.settimeout(self.timeout)
+        elif hasattr(device, "write_timeout"):
+            # Serial
+            device.write_timeout = self.timeout
+
+    def send(self, job):
+        """ Print a job on the least loaded healthy printer, trying the
+        next one on errors. Return the printer used.
+        """
+        with self._lock:
+            members = self._candidates()
+        for member in members:
+            if self._write(member, job):
+                return member.printer
+        raise PoolError("No printer of the pool could print the job")
+
+    def broadcast(self, job):
+        """ Print the same job on every healthy printer at once.
+        Return the printers that printed it.
+        """
+        with self._lock:
+            members = self._candidates()
+        results = {}
+
+        def worker(member):
+            results[member] = self._write(member, job)
+
+        threads = [threading.Thread(target=worker, args=(m,))
+                   for m in members]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        done = [m.printer for m in members if results.get(m)]
+        if not done:
+            raise PoolError("No printer of the pool could print the job")
+        return done
+
+    def job(self, broadcast=False):
+        """ Buffer a job on a Dummy printer and dispatch it on exit:
+
+          with pool.job() as p:
+              p.text("Table 4\\n")
+              p.cut()
+        """
+        return _PoolJob(self, broadcast)
+
+
+class _PoolJob:
+    """ Context manager returned by Pool.job() """
+
+    def __init__(self, pool, broadcast):
+        # Imported here, printer pulls in the USB and serial modules
+        from printer import Dummy
+        self.pool = pool
+        self.broadcast = broadcast
+        self.buffer = Dummy(pool.members[0].printer.profile or "default")
+
+    def __enter__(self):
+        return self.buffer
+
+    def __exit__(self, exc, val, trace):
+        if exc is not None:
+            return
+        if self.broadcast:
+            self.pool.broadcast(self.buffer.output)
+        else:
+            self.pool.send(self.buffer.output)
@@ -14,19 +14,22 @@ import socket
 from escpos import *
 from constants import *
 from exceptions import *
+from optimizer import optimize
 
 class Usb(Escpos):
     """ Define USB printer """
 
     def __init__(self, idVendor, idProduct, interface=0, in_ep=0x82,
-                 out_ep=0x01):
+                 out_ep=0x01, profile="default"):
         """
         @param idVendor  : Vendor ID
         @param idProduct : Product ID
         @param interface : USB device interface
         @param in_ep     : Input end point
         @param out_ep    : Output end point
+        @param profile   : Printer capability profile name
         """
+        Escpos.__init__(self, profile)
         self.idVendor = idVendor
         self.idProduct = idProduct
         self.interface = interface
@@ -83,6 +86,9 @@ class Usb(Escpos):
 
     def _raw(self, msg):
         """ Print any command sent in raw format """
+        if isinstance(msg, memoryview):
+            # pyusb wants a sequence it can turn into an array
+            msg = msg.tobytes()
         self.handle.write(msg)
 
     def __enter__ (self):
@@ -100,13 +106,15 @@ class Serial(Escpos):
     """ Define Serial printer """
 
     def __init__(self, devfile="/dev/ttyS0", baudrate=9600,
-                 bytesize=8, timeout=1):
+                 bytesize=8, timeout=1, profile="default"):
         """
         @param devfile  : Device file under dev filesystem
         @param baudrate : Baud rate for serial transmission
         @param bytesize : Serial buffer size
         @param timeout  : Read/Write timeout
+        @param profile  : Printer capability profile name
         """
+        Escpos.__init__(self, profile)
         self.devfile = devfile
         self.baudrate = baudrate
         self.bytesize = bytesize
@@ -147,19 +155,25 @@ class Serial(Escpos):
 class Network(Escpos):
     """ Define Network printer """
 
-    def __init__(self, host, port=9100):
+    def __init__(self, host, port=9100, profile="default", timeout=None):
         """
-        @param host : Printer's hostname or IP address
-        @param port : Port to write to
+        @param host    : Printer's hostname or IP address
+        @param port    : Port to write to
+        @param profile : Printer capability profile name
+        @param timeout : Seconds a connect or write may block, None waits
+                         forever
         """
+        Escpos.__init__(self, profile)
         self.host = host
         self.port = port
+        self.timeout = timeout
         self.open()
 
 
     def open(self):
         """ Open TCP socket and set it as escpos device """
         self.device = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.device.settimeout(self.timeout)
         self.device.connect((self.host, self.port))
 
         if self.device is None:
@@ -168,7 +182,7 @@ class Network(Escpos):
 
     def _raw(self, msg):
         """ Print any command sent in raw format """
-        self.device.send(msg)
+        self.device.sendall(msg)
 
     def __enter__ (self):
         return self
@@ -182,17 +196,22 @@ class Network(Escpos):
 class File(Escpos):
     """ Define Generic file printer """
 
-    def __init__(self, devfile="/dev/usb/lp0"):
+    def __init__(self, devfile="/dev/usb/lp0", profile="default"):
         """
         @param devfile : Device file under dev filesystem
+        @param profile : Printer capability profile name
         """
+        Escpos.__init__(self, profile)
         self.devfile = devfile
         self.open()
 
 
     def open(self):
-        """ Open system file """
-        self.device = open(self.devfile, "wb")
+        """ Open system file, a reopened file is appended to """
+        if self.device is None:
+            self.device = open(self.devfile, "wb")
+        else:
+            self.device = open(self.devfile, "ab")
 
         if self.device is None:
             print "Could not open the specified file %s" % self.devfile
@@ -208,3 +227,49 @@ class File(Escpos):
     def __exit__(self, exc, val, trace):
         """ Close system file """
         self.device.close()
+
+
+
+class Dummy(Escpos):
+    """ Keep the commands in memory until they are flushed to a printer """
+
+    def __init__(self, profile="default"):
+        """
+        @param profile : Printer capability profile name
+        """
+        Escpos.__init__(self, profile)
+        self._buffer = bytearray()
+
+
+    def _raw(self, msg):
+        """ Buffer any command sent in raw format """
+        self._buffer += msg
+
+    @property
+    def output(self):
+        """ Commands buffered so far """
+        return bytes(self._buffer)
+
+    def clear(self):
+        """ Drop the buffered commands """
+        self._buffer = bytearray()
+
+    def optimize(self, cut_feed=True):
+        """ Rewrite the buffered job into a shorter equivalent one.
+        Return the number of bytes saved.
+        """
+        data, saved = optimize(self.output, self.profile, cut_feed)
+        self._buffer = bytearray(data)
+        return saved
+
+    def flush(self, printer):
+        """ Send the buffered job to another printer and clear it """
+        printer._send(self._buffer)
+        self.clear()
+
+    def __enter__ (self):
+        return self
+
+    def __exit__(self, exc, val, trace):
+        """ Nothing to release """
+        pass
@@ -0,0 +1,737 @@
+""" Render ESC/POS command streams to images
+
+Gives a preview of a job at printer resolution without wasting paper:
+
+  from escpos import render
+  render.render(dummy.output, "TM-T88V").save("receipt.png")
+
+Text is drawn with cached glyph bitmaps from the default PIL font (or a
+TrueType font), bit images and raster images are decoded band by band
+and cuts are drawn as dashed lines, GS V 65/66 first feeding the lines
+cut() sends to reach the cutter. Barcodes are encoded bar by bar
+(UPC-A, UPC-E, EAN13, EAN8, CODE39, ITF, NW7 and CODE128, CODE93 is
+only outlined) with their HRI text, QR Codes sent with GS ( k are
+built with the qrcode module. Page mode is
+supported for the left to right direction only, motion units are taken
+as one dot unless GS P says otherwise.
+"""
+
+import itertools
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+import qrcode
+
+from capabilities import *
+from optimizer import tokenize, CUT_LINES, ESC, GS, NUL
+
+# Character cell of font A and font B, in dots
+FONT_CELLS = {0: (12, 24), 1: (9, 17), 2: (9, 17)}
+
+# Bar patterns of the GS k barcode types. Fixed width symbologies are
+# given as modules (1 is a bar), the others as narrow and wide elements
+# alternating between bar and space.
+
+# EAN and UPC digits: odd parity (L), even parity (G) and right hand (R)
+_EAN_L = ("0001101", "0011001", "0010011", "0111101", "0100011",
+          "0110001", "0101111", "0111011", "0110111", "0001011")
+_EAN_G = ("0100111", "0110011", "0011011", "0100001", "0011101",
+          "0111001", "0000101", "0010001", "0001001", "0010111")
+_EAN_R = ("1110010", "1100110", "1101100", "1000010", "1011100",
+          "1001110", "1010000", "1000100", "1001000", "1110100")
+# Parity of the left half of an EAN13, chosen by its first digit
+_EAN13_PARITY = ("LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG",
+                 "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL")
+# Parity of the UPC-E digits of number system 0, chosen by the check digit
+_UPCE_PARITY = ("GGGLLL", "GGLGLL", "GGLLGL", "GGLLLG", "GLGGLL",
+                "GLLGGL", "GLLLGG", "GLGLGL", "GLGLLG", "GLLGLG")
+
+_CODE39 = {
+    '0': "nnnwwnwnn", '1': "wnnwnnnnw", '2': "nnwwnnnnw", '3': "wnwwnnnnn",
+    '4': "nnnwwnnnw", '5': "wnnwwnnnn", '6': "nnwwwnnnn", '7': "nnnwnnwnw",
+    '8': "wnnwnnwnn", '9': "nnwwnnwnn", 'A': "wnnnnwnnw", 'B': "nnwnnwnnw",
+    'C': "wnwnnwnnn", 'D': "nnnnwwnnw", 'E': "wnnnwwnnn", 'F': "nnwnwwnnn",
+    'G': "nnnnnwwnw", 'H': "wnnnnwwnn", 'I': "nnwnnwwnn", 'J': "nnnnwwwnn",
+    'K': "wnnnnnnww", 'L': "nnwnnnnww", 'M': "wnwnnnnwn", 'N': "nnnnwnnww",
+    'O': "wnnnwnnwn", 'P': "nnwnwnnwn", 'Q': "nnnnnnwww", 'R': "wnnnnnwwn",
+    'S': "nnwnnnwwn", 'T': "nnnnwnwwn", 'U': "wwnnnnnnw", 'V': "nwwnnnnnw",
+    'W': "wwwnnnnnn", 'X': "nwnnwnnnw", 'Y': "wwnnwnnnn", 'Z': "nwwnwnnnn",
+    '-': "nwnnnnwnw", '.': "wwnnnnwnn", ' ': "nwwnnnwnn", '*': "nwnnwnwnn",
+    '$': "nwnwnwnnn", '/': "nwnwnnnwn", '+': "nwnnnwnwn", '%': "nnnwnwnwn",
+}
+
+# Interleaved 2 of 5 digits, drawn as bars or as the spaces between them
+_ITF = ("nnwwn", "wnnnw", "nwnnw", "wwnnn", "nnwnw",
+        "wnwnn", "nwwnn", "nnnww", "wnnwn", "nwnwn")
+
+_NW7 = {
+    '0': "nnnnnww", '1': "nnnnwwn", '2': "nnnwnnw", '3': "wwnnnnn",
+    '4': "nnwnnwn", '5': "wnnnnwn", '6': "nwnnnnw", '7': "nwnnwnn",
+    '8': "nwwnnnn", '9': "wnnwnnn", '-': "nnnwwnn", '$': "nnwwnnn",
+    ':': "wnnnwnw", '/': "wnwnnnw", '.': "wnwnwnn", '+': "nnwnwnw",
+    'A': "nnwwnwn", 'B': "nwnwnnw", 'C': "nnnwnww", 'D': "nnnwwwn",
+}
+
+# CODE128 symbols by value, as widths of bar, space, bar... in modules
+_CODE128 = (
+    "212222", "222122", "222221", "121223", "121322", "131222",
+    "122213", "122312", "132212", "221213", "221312", "231212",
+    "112232", "122132", "122231", "113222", "123122", "123221",
+    "223211", "221132", "221231", "213212", "223112", "312131",
+    "311222", "321122", "321221", "312212", "322112", "322211",
+    "212123", "212321", "232121", "111323", "131123", "131321",
+    "112313", "132113", "132311", "211313", "231113", "231311",
+    "112133", "112331", "132131", "113123", "113321", "133121",
+    "313121", "211331", "231131", "213113", "213311", "213131",
+    "311123", "311321", "331121", "312113", "312311", "332111",
+    "314111", "221411", "431111", "111224", "111422", "121124",
+    "121421", "141122", "141221", "112214", "112412", "122114",
+    "122411", "142112", "142211", "241211", "221114", "413111",
+    "241112", "134111", "111242", "121142", "121241", "114212",
+    "124112", "124211", "411212", "421112", "421211", "212141",
+    "214121", "412121", "111143", "111341", "131141", "114113",
+    "114311", "411113", "411311", "113141", "114131", "311141",
+    "411131", "211412", "211214", "211232"
+)
+_CODE128_STOP = "2331112"
+
+# Wide element of CODE39, ITF and NW7 for each GS w module width, in dots
+_WIDE = {1: 3, 2: 5, 3: 8, 4: 10, 5: 13, 6: 15}
+
+# Default page area height of ESC W
+PAGE_HEIGHT = 1662
+
+_QR_ECC = {
+    '\x30': qrcode.constants.ERROR_CORRECT_L,
+    '\x31': qrcode.constants.ERROR_CORRECT_M,
+    '\x32': qrcode.constants.ERROR_CORRECT_Q,
+    '\x33': qrcode.constants.ERROR_CORRECT_H,
+}
+
+
+def _word(data, offset):
+    """ Little endian 16 bit value """
+    return ord(data[offset]) + ord(data[offset + 1]) * 256
+
+
+def _ean_check(digits):
+    """ Check digit of an EAN or UPC number """
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        total += int(d) * (3 if i % 2 == 0 else 1)
+    return str((10 - total % 10) % 10)
+
+
+def _ean_digits(code, length):
+    """ Complete an EAN or UPC number with its check digit """
+    if not code.isdigit() or len(code) not in (length - 1, length):
+        return None
+    if len(code) == length - 1:
+        code += _ean_check(code)
+    return code
+
+
+def _encode_ean13(code):
+    code = _ean_digits(code, 13)
+    if code is None:
+        return None
+    parity = _EAN13_PARITY[int(code[0])]
+    left = [(_EAN_L if p == "L" else _EAN_G)[int(d)]
+            for d, p in zip(code[1:7], parity)]
+    right = [_EAN_R[int(d)] for d in code[7:]]
+    return "101" + "".join(left) + "01010" + "".join(right) + "101", code
+
+
+def _encode_upca(code):
+    code = _ean_digits(code, 12)
+    if code is None:
+        return None
+    # UPC-A is an EAN13 starting with 0
+    return _encode_ean13("0" + code)[0], code
+
+
+def _encode_ean8(code):
+    code = _ean_digits(code, 8)
+    if code is None:
+        return None
+    left = [_EAN_L[int(d)] for d in code[:4]]
+    right = [_EAN_R[int(d)] for d in code[4:]]
+    return "101" + "".join(left) + "01010" + "".join(right) + "101", code
+
+
+def _upce_expand(system, digits):
+    """ UPC-A number, without check digit, of a UPC-E one """
+    last = digits[5]
+    if last in "012":
+        return system + digits[:2] + last + "0000" + digits[2:5]
+    if last == "3":
+        return system + digits[:3] + "00000" + digits[3:5]
+    if last == "4":
+        return system + digits[:4] + "00000" + digits[4]
+    return system + digits[:5] + "0000" + last
+
+
+def _encode_upce(code):
+    if not code.isdigit():
+        return None
+    if len(code) in (11, 12):
+        # A UPC-A number, printed only if it can be zero suppressed
+        upca = code[:11]
+        for digits in (upca[1:3] + upca[8:11] + upca[3],
+                       upca[1:4] + upca[9:11] + "3",
+                       upca[1:5] + upca[10] + "4",
+                       upca[1:6] + upca[10]):
+            if _upce_expand(upca[0], digits) == upca:
+                break
+        else:
+            return None
+        system = upca[0]
+    elif len(code) == 6:
+        system, digits = "0", code
+    elif len(code) in (7, 8):
+        system, digits = code[0], code[1:7]
+    else:
+        return None
+    if system not in "01":
+        return None
+    check = _ean_check(_upce_expand(system, digits))
+    parity = _UPCE_PARITY[int(check)]
+    if system == "1":
+        parity = parity.replace("G", "l").replace("L", "G").replace("l", "L")
+    bars = [(_EAN_L if p == "L" else _EAN_G)[int(d)]
+            for d, p in zip(digits, parity)]
+    return "101" + "".join(bars) + "010101", system + digits + check
+
+
+def _encode_code39(code):
+    if not code.startswith("*"):
+        # The printer adds the start and stop characters
+        code = "*" + code + "*"
+    try:
+        chars = [_CODE39[c] for c in code]
+    except KeyError:
+        return None
+    return "n".join(chars), code
+
+
+def _encode_itf(code):
+    if not code.isdigit():
+        return None
+    # An odd last digit is left out
+    code = code[:len(code) / 2 * 2]
+    if not code:
+        return None
+    elements = ["nnnn"]
+    for i in range(0, len(code), 2):
+        bars, spaces = _ITF[int(code[i])], _ITF[int(code[i + 1])]
+        elements.extend(b + s for b, s in zip(bars, spaces))
+    elements.append("wnn")
+    return "".join(elements), code
+
+
+def _encode_nw7(code):
+    code = code.upper()
+    # Start and stop characters are part of the data
+    if len(code) < 2 or code[0] not in "ABCD" or code[-1] not in "ABCD":
+        return None
+    try:
+        chars = [_NW7[c] for c in code]
+    except KeyError:
+        return None
+    return "n".join(chars), code
+
+
+def _encode_code128(code):
+    """ Encode GS k 73 data, which starts with {A, {B or {C and switches
+    code set or sends a function character with { """
+    if len(code) < 2 or code[0] != "{" or code[1] not in "ABC":
+        return None
+    current = code[1]
+    values = [{"A": 103, "B": 104, "C": 105}[current]]
+    text = []
+    shift = False
+    i = 2
+    while i < len(code):
+        char = code[i]
+        if char == "{" and code[i + 1:i + 2] != "{":
+            name = code[i + 1:i + 2]
+            i += 2
+            if name in ("A", "B", "C") and name != current:
+                values.append({"A": 101, "B": 100, "C": 99}[name])
+                current = name
+            elif name == "S" and current != "C":
+                values.append(98)
+                shift = True
+            elif name in ("1", "2", "3"):
+                values.append({"1": 102, "2": 97, "3": 96}[name])
+            elif name == "4" and current != "C":
+                values.append(101 if current == "A" else 100)
+            else:
+                return None
+            continue
+        # {{ is a plain {
+        i += 2 if char == "{" else 1
+        n = ord(char)
+        charset = current
+        if shift:
+            charset = "B" if current == "A" else "A"
+            shift = False
+        if charset == "C":
+            if n > 99:
+                return None
+            values.append(n)
+            text.append("%02d" % n)
+        elif charset == "A" and n < 96:
+            values.append(n + 64 if n < 32 else n - 32)
+            text.append(char if n >= 32 else " ")
+        elif charset == "B" and 32 <= n < 128:
+            values.append(n - 32)
+            text.append(char)
+        else:
+            return None
+    check = values[0]
+    for weight, value in enumerate(values[1:]):
+        check += (weight + 1) * value
+    widths = "".join([_CODE128[v] for v in values + [check % 103]])
+    modules = []
+    for j, width in enumerate(widths + _CODE128_STOP):
+        modules.append(("1" if j % 2 == 0 else "0") * int(width))
+    return "".join(modules), "".join(text)
+
+
+# Encoders of each GS k barcode type, CODE93 is not drawn
+_BARCODES = {
+    0: _encode_upca, 65: _encode_upca,
+    1: _encode_upce, 66: _encode_upce,
+    2: _encode_ean13, 67: _encode_ean13,
+    3: _encode_ean8, 68: _encode_ean8,
+    4: _encode_code39, 69: _encode_code39,
+    5: _encode_itf, 70: _encode_itf,
+    6: _encode_nw7, 71: _encode_nw7,
+    73: _encode_code128,
+}
+
+
+class Renderer:
+    """ Turn command streams into PIL images at printer resolution.
+    Glyphs are cached, so reuse the same renderer for many jobs.
+    """
+
+    def __init__(self, profile=None, font=None):
+        """
+        @param profile : Printer profile name or object
+        @param font    : Path of a TrueType font, the PIL default bitmap
+                         font is used otherwise
+        """
+        if profile is None:
+            profile = get_profile()
+        elif not isinstance(profile, Profile):
+            profile = get_profile(profile)
+        self.profile = profile
+        self.width = profile.media_width
+        self.fontPath = font
+        self._glyphs = {}
+        self._fonts = {}
+        self._cutMark = None
+
+    # Glyphs
+
+    def _font(self, height):
+        font = self._fonts.get(height)
+        if font is None:
+            if self.fontPath:
+                font = ImageFont.truetype(self.fontPath, height)
+            else:
+                font = ImageFont.load_default()
+            self._fonts[height] = font
+        return font
+
+    def _glyph(self, char, font, wmul, hmul, bold, underline, reverse):
+        key = (char, font, wmul, hmul, bold, underline, reverse)
+        glyph = self._glyphs.get(key)
+        if glyph is None:
+            glyph = self._make_glyph(*key)
+            self._glyphs[key] = glyph
+        return glyph
+
+    def _make_glyph(self, char, font, wmul, hmul, bold, underline, reverse):
+        cellW, cellH = FONT_CELLS[font]
+        pilFont = self._font(cellH)
+        uchar = char.decode("cp437")
+        if self.fontPath:
+            glyph = Image.new("1", (cellW, cellH), 255)
+            ImageDraw.Draw(glyph).text((0, 0), uchar, font=pilFont, fill=0)
+        else:
+            # The bitmap font is small, draw it in its own box and scale.
+            # It only knows latin-1.
+            uchar = uchar.encode("latin-1", "replace")
+            glyph = Image.new("1", pilFont.getsize("M"), 255)
+            ImageDraw.Draw(glyph).text((0, 0), uchar, font=pilFont, fill=0)
+            glyph = glyph.resize((cellW, cellH), Image.NEAREST)
+        if bold:
+            shifted = Image.new("1", (cellW, cellH), 255)
+            shifted.paste(glyph, (1, 0))
+            glyph = ImageChops.logical_and(glyph, shifted)
+        if underline:
+            ImageDraw.Draw(glyph).rectangle(
+                (0, cellH - underline, cellW - 1, cellH - 1), fill=0)
+        if reverse:
+            glyph = Image.frombytes("1", glyph.size,
+                                    glyph.tobytes("raw", "1;I"))
+        if wmul != 1 or hmul != 1:
+            glyph = glyph.resize((cellW * wmul, cellH * hmul), Image.NEAREST)
+        return glyph
+
+    # Bit images
+
+    def _bit_image(self, m, count, data):
+        """ Decode ESC * column data """
+        dots = 8 if m in (0, 1) else 24
+        # A column is a row of the transposed image
+        img = Image.frombytes("1", (dots, count), data, "raw", "1;I")
+        img = img.transpose(Image.TRANSPOSE)
+        scaleX = 2 if m in (0, 32) else 1
+        scaleY = 3 if m in (0, 1) else 1
+        if scaleX != 1 or scaleY != 1:
+            img = img.resize((count * scaleX, dots * scaleY), Image.NEAREST)
+        return img
+
+    def _raster_image(self, m, rowBytes, rows, data):
+        """ Decode GS v 0 raster data """
+        img = Image.frombytes("1", (rowBytes * 8, rows), data, "raw", "1;I")
+        scaleX = 2 if m & 1 else 1
+        scaleY = 2 if m & 2 else 1
+        if scaleX != 1 or scaleY != 1:
+            img = img.resize((rowBytes * 8 * scaleX, rows * scaleY),
+                             Image.NEAREST)
+        return img
+
+    def _barcode_image(self, m, code):
+        """ Draw a barcode with its HRI text, None if the printer would
+        not print the data """
+        module = self.barcodeWidth
+        encoder = _BARCODES.get(m)
+        if encoder is None:
+            # CODE93 is drawn as an outline of its width
+            img = Image.new("1", ((len(code) * 9 + 48) * module,
+                                  self.barcodeHeight), 255)
+            ImageDraw.Draw(img).rectangle((0, 0, img.size[0] - 1,
+                                           img.size[1] - 1), outline=0)
+            text = code
+        else:
+            encoded = encoder(code)
+            if encoded is None:
+                return None
+            pattern, text = encoded
+            if pattern[0] in "01":
+                widths = [(bar == "1", len(list(run)) * module)
+                          for bar, run in itertools.groupby(pattern)]
+            else:
+                wide = _WIDE.get(module, module * 5 / 2)
+                widths = [(i % 2 == 0, wide if e == "w" else module)
+                          for i, e in enumerate(pattern)]
+            img = Image.new("1", (sum([w for bar, w in widths]),
+                                  self.barcodeHeight), 255)
+            draw = ImageDraw.Draw(img)
+            x = 0
+            for bar, w in widths:
+                if bar:
+                    draw.rectangle((x, 0, x + w - 1,
+                                    self.barcodeHeight - 1), fill=0)
+                x += w
+        if not self.hri:
+            return img
+        hri = self._text_image(text, self.hriFont)
+        height = img.size[1] + hri.size[1] * (2 if self.hri == 3 else 1)
+        block = Image.new("1", (max(img.size[0], hri.size[0]), height), 255)
+        top = 0
+        if self.hri in (1, 3):
+            block.paste(hri, ((block.size[0] - hri.size[0]) / 2, 0))
+            top = hri.size[1]
+        block.paste(img, ((block.size[0] - img.size[0]) / 2, top))
+        if self.hri in (2, 3):
+            block.paste(hri, ((block.size[0] - hri.size[0]) / 2,
+                              top + img.size[1]))
+        return block
+
+    def _qr_image(self):
+        qr = qrcode.QRCode(box_size=self.qrSize, border=0,
+                           error_correction=_QR_ECC.get(
+                               self.qrEcc, qrcode.constants.ERROR_CORRECT_M))
+        qr.add_data(self.qrData)
+        qr.make(fit=True)
+        return qr.make_image()._img.convert("1")
+
+    def _text_image(self, text, font):
+        cellW, cellH = FONT_CELLS[font]
+        img = Image.new("1", (cellW * len(text), cellH), 255)
+        for i, char in enumerate(text):
+            img.paste(self._glyph(char, font, 1, 1, False, 0, False),
+                      (i * cellW, 0))
+        return img
+
+    # Job state
+
+    def _reset(self):
+        self.font = 0
+        self.wmul = 1
+        self.hmul = 1
+        self.bold = False
+        self.underline = 0
+        self.reverse = False
+        self.align = 0
+        self.spacing = 0
+        self.unitX = 1.0
+        self.unitY = 1.0
+        self.lineSpacing = self.profile.dpi / 6
+        self.barcodeWidth = 3
+        self.barcodeHeight = 162
+        self.hri = 0
+        self.hriFont = 0
+        self.qrSize = 3
+        self.qrEcc = '\x31'
+        self.qrData = ''
+        self.page = None
+
+    def render(self, data):
+        """ Return the job as a 1-bit PIL image """
+        self._bands = []
+        self._line = []
+        self._lineX = 0
+        self._reset()
+        while data:
+            tail = None
+            for kind, cmd, key, arg in tokenize(data):
+                if kind == "raw":
+                    # Skip what can not be understood and carry on
+                    tail = cmd[2:]
+                    break
+                self._token(kind, cmd, key, arg)
+            data = tail
+        self._flush_line(0)
+        height = sum([b.size[1] for b in self._bands]) or 1
+        img = Image.new("1", (self.width, height), 255)
+        y = 0
+        for band in self._bands:
+            img.paste(band, (0, y))
+            y += band.size[1]
+        return img
+
+    def _token(self, kind, cmd, key, arg):
+        if kind == "text":
+            for char in cmd:
+                self._char(char)
+        elif kind == "lf":
+            self._feed(self.lineSpacing)
+        elif kind == "feed":
+            for i in range(arg):
+                self._feed(self.lineSpacing)
+        elif kind == "set":
+            self._setting(key, arg)
+        elif kind == "init":
+            self._flush_line(0)
+            self._reset()
+        elif kind == "cut":
+            self._cut()
+        else:
+            self._command(cmd)
+
+    def _setting(self, key, arg):
+        n = ord(arg[:1] or NUL)
+        if key == ESC + '!':
+            self.font = n & 1
+            self.bold = bool(n & 0x08)
+            self.hmul = 2 if n & 0x10 else 1
+            self.wmul = 2 if n & 0x20 else 1
+            self.underline = 1 if n & 0x80 else 0
+        elif key == ESC + 'E':
+            self.bold = bool(n & 1)
+        elif key == ESC + '-':
+            self.underline = n & 3
+        elif key == ESC + 'M':
+            self.font = n & 3 if n & 3 in FONT_CELLS else 0
+        elif key == GS + '!':
+            self.wmul = ((n >> 4) & 7) + 1
+            self.hmul = (n & 7) + 1
+        elif key == GS + 'B':
+            self.reverse = bool(n & 1)
+        elif key == ESC + 'a':
+            self.align = n & 3
+        elif key == ESC + ' ':
+            self.spacing = n
+        elif key == ESC + '3':
+            # ESC 2 has no argument and restores the default spacing
+            if arg:
+                self.lineSpacing = int(n * self.unitY)
+            else:
+                self.lineSpacing = self.profile.dpi / 6
+        elif key == GS + 'h':
+            self.barcodeHeight = n or 162
+        elif key == GS + 'w':
+            self.barcodeWidth = n
+        elif key == GS + 'H':
+            self.hri = n & 3
+        elif key == GS + 'f':
+            self.hriFont = n & 1
+
+    def _command(self, cmd):
+        prefix, name = cmd[0], cmd[1:2]
+        if prefix == ESC and name == '*':
+            m = ord(cmd[2])
+            self._inline(self._bit_image(m, _word(cmd, 3), cmd[5:]))
+        elif prefix == GS and name == 'v':
+            if self.page is None:
+                self._block(self._raster_image(ord(cmd[3]), _word(cmd, 4),
+                                               _word(cmd, 6), cmd[8:]))
+        elif prefix == GS and name == 'k':
+            m = ord(cmd[2])
+            code = cmd[3:-1] if m <= 6 else cmd[4:]
+            img = self._barcode_image(m, code)
+            if img is not None:
+                self._block(img)
+        elif prefix == GS and name == '(' and cmd[2] == 'k':
+            self._qr(cmd)
+        elif prefix == GS and name == 'V' and ord(cmd[2]) in (65, 66):
+            # Function B feeds to the cutter, then n motion units more
+            for i in range(CUT_LINES):
+                self._feed(self.lineSpacing)
+            self._feed(int(ord(cmd[3]) * self.unitY))
+            self._cut()
+        elif prefix == GS and name == 'P':
+            dpi = float(self.profile.dpi)
+            if ord(cmd[2]):
+                self.unitX = dpi / ord(cmd[2])
+            if ord(cmd[3]):
+                self.unitY = dpi / ord(cmd[3])
+        elif prefix == ESC and name == 'J':
+            self._feed(int(ord(cmd[2]) * self.unitY))
+        elif prefix == ESC and name == '$':
+            self._move(x=int(_word(cmd, 2) * self.unitX))
+        elif prefix == GS and name == '$':
+            self._move(y=int(_word(cmd, 2) * self.unitY))
+        elif prefix == ESC and name == 'L':
+            self._flush_line(0)
+            self.page = {"x": 0, "y": 0, "left": 0,
+                         "img": Image.new("1", (self.width, PAGE_HEIGHT), 255)}
+        elif prefix == ESC and name == 'W' and self.page is not None:
+            x, y = _word(cmd, 2), _word(cmd, 4)
+            w, h = _word(cmd, 6), _word(cmd, 8)
+            self.page.update({"x": 0, "y": 0, "left": int(x * self.unitX),
+                              "img": Image.new("1", (int(w * self.unitX),
+                                                     int(h * self.unitY)),
+                                               255)})
+        elif cmd == '\x0c' or (prefix == ESC and name == '\x0c'):
+            self._print_page(keep=(cmd != '\x0c'))
+        elif cmd == '\x18' and self.page is not None:
+            size = self.page["img"].size
+            self.page["img"] = Image.new("1", size, 255)
+        elif prefix == ESC and name == 'S':
+            self.page = None
+        elif cmd == '\x09':
+            cellW = FONT_CELLS[self.font][0] * self.wmul
+            self._lineX = (self._lineX / (cellW * 8) + 1) * cellW * 8
+
+    # Layout
+
+    def _char(self, char):
+        glyph = self._glyph(char, self.font, self.wmul, self.hmul,
+                            self.bold, self.underline, self.reverse)
+        self._inline(glyph, self.spacing * self.wmul)
+
+    def _inline(self, img, advance=0):
+        """ Add an element to the current line """
+        if self.page is not None:
+            page = self.page
+            page["img"].paste(img, (page["x"], page["y"] - img.size[1]))
+            page["x"] += img.size[0] + advance
+            return
+        if self._lineX + img.size[0] > self.width and self._line:
+            # The printer wraps full lines by itself
+            self._flush_line(self.lineSpacing)
+        self._line.append((self._lineX, img))
+        self._lineX += img.size[0] + advance
+
+    def _block(self, img):
+        """ Add an element printed on its own, like a barcode """
+        if self.page is not None:
+            self._inline(img)
+            return
+        if self._line:
+            self._flush_line(self.lineSpacing)
+        self._line.append((0, img))
+        self._lineX = img.size[0]
+        self._flush_line(0)
+
+    def _move(self, x=None, y=None):
+        if self.page is not None:
+            if x is not None:
+                self.page["x"] = x
+            if y is not None:
+                self.page["y"] = y
+        elif x is not None:
+            self._lineX = x
+
+    def _feed(self, dots):
+        if self.page is not None:
+            self.page["x"] = 0
+            self.page["y"] += dots
+            return
+        self._flush_line(dots)
+
+    def _flush_line(self, dots):
+        """ Print the current line and feed at least dots """
+        line = self._line
+        self._line = []
+        width = self._lineX
+        self._lineX = 0
+        if not line:
+            if dots:
+                self._bands.append(Image.new("1", (self.width, dots), 255))
+            return
+        content = max([img.size[1] for x, img in line])
+        if self.align == 1:
+            offset = max(0, (self.width - width) / 2)
+        elif self.align == 2:
+            offset = max(0, self.width - width)
+        else:
+            offset = 0
+        band = Image.new("1", (self.width, max(content, dots)), 255)
+        for x, img in line:
+            # Everything on a line sits on the same baseline
+            band.paste(img, (offset + x, content - img.size[1]))
+        self._bands.append(band)
+
+    def _print_page(self, keep):
+        if self.page is None:
+            return
+        page = self.page
+        band = Image.new("1", (self.width, page["img"].size[1]), 255)
+        band.paste(page["img"], (page["left"], 0))
+        self._bands.append(band)
+        if not keep:
+            self.page = None
+
+    def _cut(self):
+        self._flush_line(0)
+        if self._cutMark is None:
+            mark = Image.new("1", (self.width, 5), 255)
+            draw = ImageDraw.Draw(mark)
+            for x in range(0, self.width, 12):
+                draw.line((x, 2, x + 5, 2), fill=0)
+            self._cutMark = mark
+        self._bands.append(self._cutMark)
+
+    def _qr(self, cmd):
+        fn = cmd[6:7]
+        if fn == 'C':
+            self.qrSize = ord(cmd[7]) or 3
+        elif fn == 'E':
+            self.qrEcc = cmd[7]
+        elif fn == 'P':
+            self.qrData = cmd[8:]
+        elif fn == 'Q' and self.qrData:
+            self._block(self._qr_image())
+
+
+def render(data, profile=None, font=None):
+    """ Render a command stream to a 1-bit PIL image """
+    return Renderer(profile, font).render(data)
@@ -0,0 +1,158 @@
+""" TrueType text rendered to 1-bit bitmaps for printing
+
+Used for the lines the printer fonts and code page can not show (Arabic,
+CJK, emoji...). Glyphs are rendered once per font and size and kept in
+a glyph atlas with LRU eviction, lines are then composed by pasting the
+glyph masks straight into a 1-bit band.
+
+Glyphs are drawn one by one, which is fine for scripts without contextual
+shapes. Lines holding right-to-left characters are wrapped between words
+and laid out by PIL a row at a time instead, they need Pillow built with
+libraqm to be shaped properly.
+"""
+
+import collections
+import re
+import threading
+import unicodedata
+
+from PIL import Image, ImageDraw, ImageFont
+
+_atlases = {}
+_atlasesLock = threading.Lock()
+
+
+class GlyphAtlas:
+    """ Glyph bitmaps of one font at one size """
+
+    def __init__(self, font, size, capacity=1024):
+        """
+        @param font     : Path of the TrueType font
+        @param size     : Font size in dots
+        @param capacity : Number of glyphs kept in memory
+        """
+        self.font = ImageFont.truetype(font, size)
+        self.capacity = capacity
+        ascent, descent = self.font.getmetrics()
+        self.height = ascent + descent
+        self._glyphs = collections.OrderedDict()
+        # Atlases are shared, printers of a pool may render at once
+        self._lock = threading.Lock()
+
+    def glyph(self, char):
+        """ Return the mask of a character (ink is 255) and its advance """
+        with self._lock:
+            try:
+                entry = self._glyphs.pop(char)
+            except KeyError:
+                entry = self._make(char)
+                if len(self._glyphs) >= self.capacity:
+                    # Least recently used first
+                    self._glyphs.popitem(last=False)
+            self._glyphs[char] = entry
+            return entry
+
+    def _make(self, char):
+        font = self.font
+        if hasattr(font, "getlength"):
+            advance = int(round(font.getlength(char)))
+            right = font.getbbox(char)[2]
+        else:
+            right = font.getsize(char)[0]
+            advance = right
+        mask = Image.new("1", (max(right, advance, 1), self.height), 0)
+        ImageDraw.Draw(mask).text((0, 0), char, font=font, fill=255)
+        return mask, advance
+
+    def __len__(self):
+        return len(self._glyphs)
+
+
+def get_atlas(font, size, capacity=1024):
+    """ Return the atlas shared by every user of a font, size and
+    capacity """
+    key = (font, size, capacity)
+    with _atlasesLock:
+        atlas = _atlases.get(key)
+        if atlas is None:
+            atlas = _atlases[key] = GlyphAtlas(font, size, capacity)
+    return atlas
+
+
+def _right_to_left(text):
+    for char in text:
+        if unicodedata.bidirectional(char) in ("R", "AL"):
+            return True
+    return False
+
+
+class TrueTypeText:
+    """ Render unicode text to 1-bit images with a TrueType font """
+
+    def __init__(self, font, size=24, capacity=1024):
+        """
+        @param font     : Path of the TrueType font
+        @param size     : Font size in dots
+        @param capacity : Number of glyphs kept in the atlas
+        """
+        self.atlas = get_atlas(font, size, capacity)
+
+    def render(self, text, width):
+        """ Return a 1-bit image of the given width holding the text,
+        wrapped on as many rows as needed """
+        if _right_to_left(text):
+            return self._render_layout(text, width)
+        atlas = self.atlas
+        rows = [[]]
+        x = 0
+        for char in text:
+            mask, advance = atlas.glyph(char)
+            if x + advance > width and rows[-1]:
+                rows.append([])
+                x = 0
+            rows[-1].append((x, mask))
+            x += advance
+        height = atlas.height
+        band = Image.new("1", (width, height * len(rows)), 255)
+        for i, row in enumerate(rows):
+            top = i * height
+            for x, mask in row:
+                if x + mask.size[0] > width:
+                    mask = mask.crop((0, 0, width - x, height))
+                # Only the ink is pasted, overhangs do not erase neighbours
+                band.paste(0, (x, top, x + mask.size[0], top + height), mask)
+        return band
+
+    def _render_layout(self, text, width):
+        font = self.atlas.font
+        draw = ImageDraw.Draw(Image.new("1", (1, 1)))
+
+        def length(line):
+            if hasattr(font, "getlength"):
+                return int(font.getlength(line))
+            return draw.textsize(line, font=font)[0]
+
+        # Wrap word by word in logical order, words wider than the paper
+        # are cut between characters
+        rows = []
+        row = u""
+        for word in re.findall(r"\S+\s*", text):
+            if row and length((row + word).rstrip()) > width:
+                rows.append(row.rstrip())
+                row = u""
+            row += word
+            while len(row) > 1 and length(row.rstrip()) > width:
+                cut = len(row) - 1
+                while cut > 1 and length(row[:cut]) > width:
+                    cut -= 1
+                rows.append(row[:cut])
+                row = row[cut:]
+        rows.append(row.rstrip())
+        height = self.atlas.height
+        band = Image.new("1", (width, height * len(rows)), 255)
+        draw = ImageDraw.Draw(band)
+        for i, line in enumerate(rows):
+            # Right-to-left lines start from the right margin
+            draw.text((max(0, width - length(line)), i * height), line,
+                      font=font, fill=0)
+        return band
@@ -16,7 +16,7 @@ setup(
     packages=[
         'escpos',
     ],
-    package_data={'': ['COPYING']},
+    package_data={'': ['COPYING'], 'escpos': ['capabilities.json']},
     classifiers=[
         'Development Status :: 1 - Alpha',
         'License :: OSI Approved :: GNU GPL v3',